@@ -2,20 +2,51 @@ from django.contrib import admin
 from core.models.signal_user import SignalUser
 from core.models.signal_group import SignalGroup
 from core.models.signal_message import SignalMessage
+from core.models.signal_outbox import OutboundMessage
+from core.paginator import EstimatedCountPaginator
 
 
 class SignalUserAdmin(admin.ModelAdmin):
-    pass
+    list_display = ("source_number", "display_name", "source_name", "is_registered")
+    list_filter = ("is_registered",)
+    search_fields = ("source_number", "display_name")
 
 
 class SignalGroupAdmin(admin.ModelAdmin):
-    pass
+    list_display = ("name", "signal_id", "owner")
+    list_select_related = ("owner",)
+    raw_id_fields = ("owner", "members")
+    search_fields = ("name",)
 
 
 class SignalMessageAdmin(admin.ModelAdmin):
-    pass
+    list_display = ("received_at", "source_user", "target_user", "target_group", "is_incoming", "text_preview")
+    list_select_related = ("source_user", "target_user", "target_group")
+    # Range filters on the received_at index, a date_hierarchy would list the distinct dates of every row
+    list_filter = (("received_at", admin.DateFieldListFilter), "is_incoming")
+    ordering = ("-received_at",)
+    raw_id_fields = ("source_user", "target_user", "target_group")
+    readonly_fields = ("raw_content",)
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @admin.display(description="Text content")
+    def text_preview(self, obj: SignalMessage) -> str:
+        return obj.text_content[:80]
+
+
+class OutboundMessageAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "source_user", "target_user", "target_group", "status", "attempts", "sent_at")
+    list_select_related = ("source_user", "target_user", "target_group")
+    list_filter = ("status",)
+    raw_id_fields = ("source_user", "target_user", "target_group")
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(SignalMessage, SignalMessageAdmin)
 admin.site.register(SignalGroup, SignalGroupAdmin)
 admin.site.register(SignalUser, SignalUserAdmin)
+admin.site.register(OutboundMessage, OutboundMessageAdmin)
@@ -0,0 +1,163 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections
+
+from core import metrics
+from core.signal_client.envelopes import persist_events
+
+logger = logging.getLogger(name=__name__)
+
+
+class EventBuffer:
+    """
+    In-process buffer of incoming signal-cli events, drained by a background thread
+    every `flush_events` events or `flush_interval_seconds`, whichever comes first.
+
+    A batch failing on an unavailable database is put back at the head of the buffer and retried
+    with an exponential backoff up to `retry_max_seconds`, so that pushes are rejected once full.
+    """
+
+    def __init__(self, flush_events: int, flush_interval_seconds: float, max_events: int, retry_max_seconds: float):
+        self.flush_events = flush_events
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_events = max_events
+        self.retry_max_seconds = retry_max_seconds
+
+        self._events: List[Dict[str, Any]] = []
+        self._oldest_event_at: float = 0.0
+        self._retry_backoff: float = 0.0
+        self._retry_at: Optional[float] = None
+        self._condition = threading.Condition()
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_pid: Optional[int] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self._events)
+
+    def push(self, events: List[Dict[str, Any]]) -> bool:
+        """
+        Add `events` to the buffer, return False if it is full.
+        """
+        with self._condition:
+            if len(self._events) + len(events) > self.max_events:
+                metrics.increment("ingestion.rejected_events", len(events))
+                return False
+
+            was_empty = len(self._events) == 0
+            if was_empty:
+                self._oldest_event_at = time.monotonic()
+            self._events.extend(events)
+            metrics.set_gauge("ingestion.buffer_depth", len(self._events))
+            self._ensure_flusher()
+            # An idle flusher waits without timeout, it has to start the interval of the first event
+            if was_empty or len(self._events) >= self.flush_events:
+                self._condition.notify()
+
+        return True
+
+    def flush(self) -> bool:
+        """
+        Store the oldest batch of events, return False if it was put back to be retried.
+        """
+        with self._condition:
+            events = self._take()
+        return self._persist(events)
+
+    def _take(self) -> List[Dict[str, Any]]:
+        events, self._events = self._events[:self.flush_events], self._events[self.flush_events:]
+        self._oldest_event_at = time.monotonic()
+        metrics.set_gauge("ingestion.buffer_depth", len(self._events))
+        return events
+
+    def _persist(self, events: List[Dict[str, Any]]) -> bool:
+        if len(events) == 0:
+            return True
+
+        started_at = time.monotonic()
+        close_old_connections()
+        try:
+            persist_events(events)
+        except (OperationalError, InterfaceError):
+            # The events were already acknowledged, keep them until the database is back
+            logger.exception("Failed to persist %d events, retrying", len(events))
+            self._retry(events)
+            return False
+        except Exception:
+            # Any other error would fail again on each retry and block the buffer
+            metrics.increment("ingestion.lost_events", len(events))
+            logger.exception("Failed to persist %d events", len(events))
+        else:
+            metrics.increment("ingestion.persisted_events", len(events))
+        finally:
+            metrics.observe("ingestion.flush_seconds", time.monotonic() - started_at)
+
+        with self._condition:
+            self._retry_backoff = 0.0
+        return True
+
+    def _retry(self, events: List[Dict[str, Any]]):
+        metrics.increment("ingestion.retried_events", len(events))
+        with self._condition:
+            self._events[:0] = events
+            metrics.set_gauge("ingestion.buffer_depth", len(self._events))
+            self._retry_backoff = min(
+                max(self._retry_backoff * 2, self.flush_interval_seconds),
+                self.retry_max_seconds,
+            )
+            self._retry_at = time.monotonic() + self._retry_backoff
+
+    def _ensure_flusher(self):
+        # A thread started before a fork does not exist in the child process
+        if self._flusher is not None and self._flusher_pid == os.getpid():
+            return
+
+        self._flusher = threading.Thread(target=self._run, name="ingestion-flusher", daemon=True)
+        self._flusher_pid = os.getpid()
+        self._flusher.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._retry_at is not None:
+                        remaining = self._retry_at - time.monotonic()
+                        if remaining > 0:
+                            self._condition.wait(timeout=remaining)
+                            continue
+                        self._retry_at = None
+                    if len(self._events) >= self.flush_events:
+                        break
+                    if len(self._events) > 0:
+                        remaining = self.flush_interval_seconds - (time.monotonic() - self._oldest_event_at)
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(timeout=remaining)
+                    else:
+                        self._condition.wait()
+                events = self._take()
+
+            self._persist(events)
+
+
+event_buffer = EventBuffer(
+    flush_events=settings.INGESTION_FLUSH_EVENTS,
+    flush_interval_seconds=settings.INGESTION_FLUSH_INTERVAL_MS / 1000,
+    max_events=settings.INGESTION_BUFFER_MAX_EVENTS,
+    retry_max_seconds=settings.INGESTION_RETRY_MAX_SECONDS,
+)
+
+
+@atexit.register
+def _flush_on_exit():
+    while event_buffer.depth > 0:
+        if not event_buffer.flush():
+            metrics.increment("ingestion.lost_events", event_buffer.depth)
+            logger.error("Exiting with %d events not persisted", event_buffer.depth)
+            return
@@ -0,0 +1,90 @@
+import gzip
+import os
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core import serializers
+from django.core.management.base import BaseCommand, CommandError
+from django.db.transaction import atomic
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = "Delete, or archive then delete, the rows older than their model's retention (settings.DATA_RETENTION)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Seconds to sleep between batches, to spread the load and the WAL",
+        )
+        parser.add_argument(
+            "--archive-dir",
+            default=None,
+            help="Append the deleted rows to a gzipped JSON lines file per model in this directory",
+        )
+
+    def handle(self, *args, **options):
+        if options["archive_dir"] is not None:
+            os.makedirs(options["archive_dir"], exist_ok=True)
+
+        for label, retention in settings.DATA_RETENTION.items():
+            if retention["days"] is None:
+                continue
+
+            try:
+                model = apps.get_model(label)
+            except LookupError as error:
+                raise CommandError(f"Unknown model {label} in DATA_RETENTION") from error
+
+            cutoff = timezone.now() - timedelta(days=retention["days"])
+            archive_path = (
+                os.path.join(options["archive_dir"], f"{label.lower()}-{timezone.now():%Y%m%d}.jsonl.gz")
+                if options["archive_dir"] is not None else None
+            )
+
+            started_at = time.monotonic()
+            removed = self.prune(model, retention["field"], cutoff, options["batch_size"], options["pause"], archive_path)
+            elapsed = time.monotonic() - started_at
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{label}: removed {removed} rows older than {cutoff:%Y-%m-%d %H:%M}"
+                    f" in {elapsed:.1f}s ({removed / elapsed if elapsed > 0 else 0:.0f} rows/s)"
+                )
+            )
+
+    def prune(self, model, field: str, cutoff, batch_size: int, pause: float, archive_path) -> int:
+        # The base manager does not defer any column, archives hold the complete rows
+        manager = model._base_manager
+        removed = 0
+
+        while True:
+            # Small batches walking the index of `field` keep locks and WAL bursts short
+            pks = list(
+                manager.filter(
+                    **{f"{field}__lt": cutoff}
+                ).order_by(
+                    field
+                ).values_list(
+                    "pk",
+                    flat=True,
+                )[:batch_size]
+            )
+            if len(pks) == 0:
+                return removed
+
+            with atomic():
+                batch = manager.filter(pk__in=pks)
+                if archive_path is not None:
+                    with gzip.open(archive_path, "at") as archive:
+                        archive.write(serializers.serialize("jsonl", batch))
+                deleted, _deleted_by_model = batch.delete()
+
+            removed += deleted
+            if pause > 0:
+                time.sleep(pause)
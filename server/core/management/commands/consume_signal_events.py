@@ -0,0 +1,89 @@
+import json
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.ingestion import event_buffer
+from core.signal_client.envelopes import is_valid_event
+
+
+class Command(BaseCommand):
+    help = "Consume signal-cli's event stream and store the events directly, without the sse-client relay"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reconnect-min-seconds", type=float, default=1.0)
+        parser.add_argument("--reconnect-max-seconds", type=float, default=30.0)
+        parser.add_argument(
+            "--read-timeout-seconds",
+            type=float,
+            default=60.0,
+            help="Reconnect when nothing, keep-alive comments included, is received for this long",
+        )
+
+    def handle(self, *args, **options):
+        self.last_event_id: Optional[str] = None
+        backoff = options["reconnect_min_seconds"]
+
+        with requests.Session() as session:
+            while True:
+                try:
+                    for event in self.read_events(session, options["read_timeout_seconds"]):
+                        backoff = options["reconnect_min_seconds"]
+                        self.push(event)
+                except requests.RequestException as error:
+                    self.stderr.write(f"Event stream failed: {error!r}")
+
+                self.stderr.write(f"Reconnecting to the event stream in {backoff:.0f}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, options["reconnect_max_seconds"])
+
+    def read_events(self, session: requests.Session, read_timeout: float) -> Iterator[Dict[str, Any]]:
+        headers = {"Accept": "text/event-stream"}
+        if self.last_event_id is not None:
+            headers["Last-Event-ID"] = self.last_event_id
+
+        with session.get(
+            settings.SIGNAL_URL.rstrip("/") + "/api/v1/events",
+            headers=headers,
+            stream=True,
+            # Without a read timeout, a half-open connection would never be noticed
+            timeout=(settings.REQUESTS_TIMEOUT_SECONDS, read_timeout),
+        ) as response:
+            response.raise_for_status()
+            # Without a charset in text/event-stream, requests would decode ISO-8859-1, SSE is always UTF-8
+            response.encoding = "utf-8"
+            self.stdout.write("Connected to the event stream")
+
+            data_lines: List[str] = []
+            for line in response.iter_lines(decode_unicode=True):
+                if line == "":
+                    # An empty line dispatches the event
+                    if len(data_lines) > 0:
+                        data = "\n".join(data_lines)
+                        data_lines = []
+                        try:
+                            yield json.loads(data)
+                        except json.JSONDecodeError:
+                            self.stderr.write(f"Failed to decode JSON: {data}")
+                    continue
+                if line.startswith(":"):
+                    continue
+
+                field, _colon, value = line.partition(":")
+                if value.startswith(" "):
+                    value = value[1:]
+                if field == "data":
+                    data_lines.append(value)
+                elif field == "id":
+                    self.last_event_id = value
+
+    def push(self, event: Dict[str, Any]):
+        if not is_valid_event(event):
+            return
+
+        # The buffer stores the events by batches from its own thread, wait for it when it is full
+        while not event_buffer.push([event]):
+            time.sleep(0.1)
@@ -0,0 +1,153 @@
+import time
+from datetime import timedelta
+from typing import Dict, List
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from core import metrics
+from core.models.signal_outbox import OutboundMessage
+from core.signal_client import rate_limit
+from core.signal_client.client import SignalClient
+
+
+class Command(BaseCommand):
+    help = "Dispatch pending outbound messages, several workers can run in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds to sleep when the outbox is empty")
+        parser.add_argument("--max-attempts", type=int, default=5)
+        parser.add_argument(
+            "--lease-seconds",
+            type=float,
+            default=300.0,
+            help="Claimed messages become available again after this delay if the worker dies",
+        )
+        parser.add_argument("--once", action="store_true", help="Exit once the outbox is drained")
+
+    def handle(self, *args, **options):
+        self.clients: Dict[str, SignalClient] = dict()
+
+        while True:
+            dispatched = self.dispatch_batch(options["batch_size"], options["max_attempts"], options["lease_seconds"])
+            if dispatched > 0:
+                rate_limit_wait = metrics.snapshot()["timings"].get("signal.rate_limit.wait_seconds", {})
+                self.stdout.write(
+                    f"Dispatched {dispatched} messages"
+                    f" (waited {rate_limit_wait.get('total', 0.0):.2f}s on the rate limiter so far)"
+                )
+                continue
+
+            if options["once"]:
+                return
+            time.sleep(options["poll_interval"])
+
+    def dispatch_batch(self, batch_size: int, max_attempts: int, lease_seconds: float) -> int:
+        with atomic():
+            # Rows claimed by another worker are skipped instead of waited for
+            claimed: List[OutboundMessage] = list(
+                OutboundMessage.objects.select_for_update(
+                    skip_locked=True,
+                    of=("self",),
+                ).select_related(
+                    "source_user",
+                    "target_user",
+                    "target_group",
+                ).filter(
+                    status=OutboundMessage.Status.PENDING,
+                    available_at__lte=timezone.now(),
+                ).order_by(
+                    "available_at",
+                    "id",
+                )[:batch_size]
+            )
+            if len(claimed) == 0:
+                return 0
+
+            # The claim is a lease rather than a long-held lock, so that waiting on the
+            # rate limiter or on signal-cli does not keep a transaction open
+            lease_end = timezone.now() + timedelta(seconds=lease_seconds)
+            for outbound_message in claimed:
+                outbound_message.available_at = lease_end
+            OutboundMessage.objects.bulk_update(claimed, fields=["available_at"])
+
+        # Waiting on the rate limiter must not outlive the lease, or another worker would claim and
+        # send the messages again: half of it is left to send the batch
+        by_source: Dict[str, List[OutboundMessage]] = dict()
+        for outbound_message in self.throttle(claimed, max_total_wait_seconds=lease_seconds / 2):
+            by_source.setdefault(outbound_message.source_user_id, []).append(outbound_message)
+
+        for outbound_messages in by_source.values():
+            self.send(outbound_messages, max_attempts)
+
+        OutboundMessage.objects.bulk_update(
+            claimed,
+            fields=["status", "attempts", "last_error", "available_at", "sent_at"],
+        )
+
+        return len(claimed)
+
+    def throttle(self, outbound_messages: List[OutboundMessage], max_total_wait_seconds: float) -> List[OutboundMessage]:
+        """
+        Take rate limiter tokens for `outbound_messages`, waiting for short delays and
+        requeuing the messages whose delay is longer or would exceed `max_total_wait_seconds`
+        over the whole batch. Return the messages allowed to be sent.
+        """
+        deadline = time.monotonic() + max_total_wait_seconds
+        allowed: List[OutboundMessage] = []
+        for outbound_message in outbound_messages:
+            limits = [
+                rate_limit.account_limit(outbound_message.source_user),
+                rate_limit.recipient_limit(outbound_message.recipient),
+            ]
+
+            waited_seconds = 0.0
+            wait_seconds = rate_limit.acquire(limits)
+            while 0 < wait_seconds <= min(settings.SIGNAL_RATE_LIMIT_MAX_WAIT_SECONDS, deadline - time.monotonic()):
+                time.sleep(wait_seconds)
+                waited_seconds += wait_seconds
+                wait_seconds = rate_limit.acquire(limits)
+
+            metrics.observe("signal.rate_limit.wait_seconds", waited_seconds)
+            if wait_seconds > 0:
+                metrics.increment("signal.rate_limit.requeued")
+                outbound_message.available_at = timezone.now() + timedelta(seconds=wait_seconds)
+                continue
+
+            allowed.append(outbound_message)
+
+        return allowed
+
+    def send(self, outbound_messages: List[OutboundMessage], max_attempts: int):
+        source_user = outbound_messages[0].source_user
+        try:
+            client = self.clients.get(source_user.source_number)
+            if client is None:
+                client = self.clients[source_user.source_number] = SignalClient(source_user)
+            results = client.send_batch(
+                [
+                    (outbound_message.text_content, [outbound_message.recipient])
+                    for outbound_message in outbound_messages
+                ]
+            )
+            errors = [result.error for result in results]
+        except Exception as error:
+            self.stderr.write(f"Failed to dispatch messages of {source_user.source_number}: {error}")
+            errors = [error] * len(outbound_messages)
+
+        now = timezone.now()
+        for outbound_message, error in zip(outbound_messages, errors):
+            outbound_message.attempts += 1
+            if error is None:
+                outbound_message.status = OutboundMessage.Status.SENT
+                outbound_message.sent_at = now
+                outbound_message.last_error = ""
+            elif outbound_message.attempts >= max_attempts:
+                outbound_message.status = OutboundMessage.Status.FAILED
+                outbound_message.last_error = str(error)
+            else:
+                outbound_message.last_error = str(error)
+                outbound_message.available_at = now + timedelta(seconds=2 ** outbound_message.attempts)
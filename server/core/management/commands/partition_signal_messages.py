@@ -0,0 +1,169 @@
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.transaction import atomic
+
+from core.models.signal_message import SignalMessage
+
+PARTITION_KEY = "received_at"
+
+
+def month_start(value: datetime, months: int = 0) -> datetime:
+    month_index = value.year * 12 + value.month - 1 + months
+    return datetime(month_index // 12, month_index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+class Command(BaseCommand):
+    help = "Partition SignalMessage by month of `received_at`, create upcoming partitions and detach old ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="Convert the table to a partitioned one, rows are copied once",
+        )
+        parser.add_argument("--months-ahead", type=int, default=3, help="Number of upcoming monthly partitions")
+        parser.add_argument(
+            "--detach-older-than",
+            type=int,
+            default=None,
+            help="Detach the partitions of messages older than this number of months",
+        )
+        parser.add_argument("--drop", action="store_true", help="Drop the detached partitions instead of keeping them")
+
+    def handle(self, *args, **options):
+        self.table = SignalMessage._meta.db_table
+
+        with connection.cursor() as cursor:
+            self.cursor = cursor
+
+            if options["convert"]:
+                if self.is_partitioned():
+                    raise CommandError(f"{self.table} is already partitioned")
+                with atomic():
+                    self.convert()
+            elif not self.is_partitioned():
+                raise CommandError(f"{self.table} is not partitioned, run with --convert first")
+
+            now = datetime.now(tz=timezone.utc)
+            for months in range(options["months_ahead"] + 1):
+                self.create_partition(self.table, month_start(now, months))
+
+            if options["detach_older_than"] is not None:
+                self.detach(month_start(now, -options["detach_older_than"]), options["drop"])
+
+    def is_partitioned(self) -> bool:
+        self.cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)",
+            [self.table],
+        )
+        return self.cursor.fetchone()[0]
+
+    def create_partition(self, parent: str, start: datetime):
+        end = month_start(start, 1)
+        name = f"{self.table}_p{start:%Y%m}"
+        default = f"{self.table}_default"
+        self.cursor.execute(
+            "SELECT to_regclass(%s) IS NOT NULL, to_regclass(%s) IS NOT NULL",
+            [f'"{name}"', f'"{default}"'],
+        )
+        exists, has_default = self.cursor.fetchone()
+        if exists:
+            return
+
+        bounds = f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        if not has_default:
+            self.cursor.execute(f'CREATE TABLE "{name}" PARTITION OF "{parent}" {bounds}')
+            return
+
+        # The default partition holds the messages dated after the existing partitions, such as the ones
+        # with a sender's clock ahead. Attaching a partition fails while it holds rows of its range.
+        with atomic():
+            self.cursor.execute(f'LOCK TABLE "{default}" IN SHARE ROW EXCLUSIVE MODE')
+            self.cursor.execute(f'CREATE TABLE "{name}" (LIKE "{parent}" INCLUDING DEFAULTS)')
+            self.cursor.execute(
+                f'WITH moved AS (DELETE FROM "{default}"'
+                f" WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s RETURNING *)"
+                f' INSERT INTO "{name}" SELECT * FROM moved',
+                [start, end],
+            )
+            self.cursor.execute(f'ALTER TABLE "{parent}" ATTACH PARTITION "{name}" {bounds}')
+
+    def convert(self):
+        legacy = self.table
+        partitioned = f"{self.table}_partitioned"
+        sequence = f"{self.table}_partitioned_id_seq"
+
+        # Constraints and plain indexes are replayed once the rows are copied
+        self.cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint"
+            " WHERE conrelid = %s::regclass ORDER BY contype",
+            [legacy],
+        )
+        constraints: List[Tuple[str, str, str]] = self.cursor.fetchall()
+        for name, constraint_type, definition in constraints:
+            if constraint_type == "u" and PARTITION_KEY not in definition:
+                raise CommandError(f"Unique constraint {name} must include {PARTITION_KEY} to partition the table")
+        self.cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN"
+            " (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)",
+            [legacy, legacy],
+        )
+        index_definitions: List[str] = [row[0] for row in self.cursor.fetchall()]
+
+        self.cursor.execute(f'LOCK TABLE "{legacy}" IN EXCLUSIVE MODE')
+        self.cursor.execute(
+            f'CREATE TABLE "{partitioned}" (LIKE "{legacy}" INCLUDING DEFAULTS)'
+            f" PARTITION BY RANGE ({PARTITION_KEY})"
+        )
+        self.cursor.execute(f'CREATE TABLE "{self.table}_default" PARTITION OF "{partitioned}" DEFAULT')
+
+        self.cursor.execute(f'SELECT MIN({PARTITION_KEY}), MAX({PARTITION_KEY}), MAX(id) FROM "{legacy}"')
+        oldest, newest, max_id = self.cursor.fetchone()
+        if oldest is not None:
+            start = month_start(oldest)
+            while start <= newest:
+                self.create_partition(partitioned, start)
+                start = month_start(start, 1)
+
+        self.cursor.execute(f'INSERT INTO "{partitioned}" SELECT * FROM "{legacy}"')
+        self.cursor.execute(f'DROP TABLE "{legacy}"')
+        self.cursor.execute(f'ALTER TABLE "{partitioned}" RENAME TO "{self.table}"')
+
+        # Identity columns are not supported on partitioned tables by every Postgres version
+        self.cursor.execute(f'CREATE SEQUENCE "{sequence}" OWNED BY "{self.table}".id')
+        self.cursor.execute("SELECT setval(%s, %s, false)", [sequence, (max_id or 0) + 1])
+        self.cursor.execute(f"""ALTER TABLE "{self.table}" ALTER COLUMN id SET DEFAULT nextval('"{sequence}"')""")
+
+        for name, constraint_type, definition in constraints:
+            if constraint_type == "p":
+                definition = f"PRIMARY KEY (id, {PARTITION_KEY})"
+            self.cursor.execute(f'ALTER TABLE "{self.table}" ADD CONSTRAINT "{name}" {definition}')
+        for index_definition in index_definitions:
+            self.cursor.execute(index_definition)
+
+        self.stdout.write(self.style.SUCCESS(f"Converted {self.table} to a partitioned table"))
+
+    def detach(self, before: datetime, drop: bool):
+        self.cursor.execute(
+            "SELECT child.relname FROM pg_inherits"
+            " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+            " WHERE pg_inherits.inhparent = %s::regclass",
+            [self.table],
+        )
+        partitions = sorted(row[0] for row in self.cursor.fetchall())
+
+        for partition in partitions:
+            suffix = partition.rsplit("_p", 1)[-1]
+            if not suffix.isdigit() or suffix >= f"{before:%Y%m}":
+                continue
+
+            # Detaching only updates the catalog, the rows stay in the detached table
+            self.cursor.execute(f'ALTER TABLE "{self.table}" DETACH PARTITION "{partition}"')
+            if drop:
+                self.cursor.execute(f'DROP TABLE "{partition}"')
+                self.stdout.write(f"Dropped {partition}")
+            else:
+                self.stdout.write(f"Detached {partition}, it can now be archived and dropped")
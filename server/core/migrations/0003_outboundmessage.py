@@ -0,0 +1,39 @@
+# Generated by Django 4.2.10 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_signalmessage_target_user_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text_content', models.TextField(verbose_name='Text content')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=16, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Last error')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Available for dispatch at')),
+                ('sent_at', models.DateTimeField(null=True, verbose_name='Sent at')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Model created at')),
+                ('modified_at', models.DateTimeField(auto_now=True, verbose_name='Model modified at')),
+                ('source_user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='outbound_messages', to='core.signaluser', verbose_name='Source User')),
+                ('target_group', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='queued_messages', to='core.signalgroup', verbose_name='Target Group')),
+                ('target_user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='queued_messages', to='core.signaluser', verbose_name='Target User')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'available_at'], name='core_outbou_status_c88413_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='outboundmessage',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(models.Q(('target_user__isnull', False), ('target_group__isnull', True)), models.Q(('target_user__isnull', True), ('target_group__isnull', False)), _connector='OR')), name='outbound_only_one_target_allowed', violation_error_message='Only one of target_group and target_user field can be set'),
+        ),
+    ]
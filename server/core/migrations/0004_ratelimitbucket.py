@@ -0,0 +1,21 @@
+# Generated by Django 4.2.10 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_outboundmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Key')),
+                ('tokens', models.FloatField(verbose_name='Available tokens')),
+                ('updated_at', models.DateTimeField(verbose_name='Tokens updated at')),
+            ],
+        ),
+    ]
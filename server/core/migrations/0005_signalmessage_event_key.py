@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='signalmessage',
+            name='event_key',
+            field=models.CharField(max_length=255, null=True, unique=True, verbose_name='Event key'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_signalmessage_event_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='signalmessage',
+            name='event_key',
+            field=models.CharField(max_length=255, null=True, verbose_name='Event key'),
+        ),
+        migrations.AddConstraint(
+            model_name='signalmessage',
+            constraint=models.UniqueConstraint(fields=('event_key', 'received_at'), name='unique_event_key_received'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.10 on 2026-10-18 15:47
+
+import json
+import zlib
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def compress_raw_content(apps, schema_editor):
+    SignalMessage = apps.get_model("core", "SignalMessage")
+
+    batch = []
+    for message in SignalMessage.objects.filter(raw_content__isnull=False).only("id", "raw_content").iterator(chunk_size=BATCH_SIZE):
+        message.compressed_raw_content = zlib.compress(json.dumps(message.raw_content).encode())
+        batch.append(message)
+        if len(batch) >= BATCH_SIZE:
+            SignalMessage.objects.bulk_update(batch, fields=["compressed_raw_content"])
+            batch = []
+    SignalMessage.objects.bulk_update(batch, fields=["compressed_raw_content"])
+
+
+def decompress_raw_content(apps, schema_editor):
+    SignalMessage = apps.get_model("core", "SignalMessage")
+
+    batch = []
+    for message in SignalMessage.objects.filter(compressed_raw_content__isnull=False).only("id", "compressed_raw_content").iterator(chunk_size=BATCH_SIZE):
+        message.raw_content = json.loads(zlib.decompress(message.compressed_raw_content))
+        batch.append(message)
+        if len(batch) >= BATCH_SIZE:
+            SignalMessage.objects.bulk_update(batch, fields=["raw_content"])
+            batch = []
+    SignalMessage.objects.bulk_update(batch, fields=["raw_content"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_alter_signalmessage_event_key_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='signalmessage',
+            name='compressed_raw_content',
+            field=models.BinaryField(null=True, verbose_name='Compressed raw content'),
+        ),
+        migrations.RunPython(compress_raw_content, decompress_raw_content),
+        migrations.RemoveField(
+            model_name='signalmessage',
+            name='raw_content',
+        ),
+    ]
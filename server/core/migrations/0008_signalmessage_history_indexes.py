@@ -0,0 +1,25 @@
+# Generated by Django 4.2.10 on 2026-10-18 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_signalmessage_compressed_raw_content'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='signalmessage',
+            index=models.Index(fields=['target_group', 'received_at', 'id'], name='core_signal_target__288cbf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='signalmessage',
+            index=models.Index(fields=['target_user', 'received_at', 'id'], name='core_signal_target__06d900_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='signalmessage',
+            index=models.Index(fields=['source_user', 'received_at', 'id'], name='core_signal_source__27f759_idx'),
+        ),
+    ]
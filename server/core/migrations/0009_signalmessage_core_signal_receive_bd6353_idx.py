@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_signalmessage_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='signalmessage',
+            index=models.Index(fields=['received_at'], name='core_signal_receive_bd6353_idx'),
+        ),
+    ]
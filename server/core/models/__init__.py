@@ -1,3 +1,5 @@
 from .signal_group import *
 from .signal_user import *
 from .signal_message import *
+from .signal_outbox import *
+from .rate_limit import *
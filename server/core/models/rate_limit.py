@@ -0,0 +1,7 @@
+from django.db import models
+
+
+class RateLimitBucket(models.Model):
+    key = models.CharField(verbose_name="Key", max_length=255, primary_key=True)
+    tokens = models.FloatField(verbose_name="Available tokens")
+    updated_at = models.DateTimeField(verbose_name="Tokens updated at")
@@ -1,10 +1,117 @@
+import json
+import zlib
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
 from django.db import models
 from core.models.signal_group import SignalGroup
 from core.models.signal_user import SignalUser
 
 
+class SignalMessageQuerySet(models.QuerySet):
+    # Filters that page() runs as separate index-ordered queries, see with_user
+    _keyset_branches: Optional[Tuple[models.Q, ...]] = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._keyset_branches = self._keyset_branches
+        return clone
+
+    def in_group(self, group: SignalGroup) -> "SignalMessageQuerySet":
+        return self.filter(target_group=group)
+
+    def from_user(self, user: SignalUser) -> "SignalMessageQuerySet":
+        return self.filter(source_user=user)
+
+    def to_user(self, user: SignalUser) -> "SignalMessageQuerySet":
+        return self.filter(target_user=user)
+
+    def with_user(self, user: SignalUser) -> "SignalMessageQuerySet":
+        """
+        Direct messages exchanged with `user`, in both directions.
+
+        No single index is ordered for this OR, page() reads each direction along its own
+        index instead and merges them, other queries have to sort all the matching messages.
+        """
+        sent = models.Q(source_user=user, target_group__isnull=True) & ~models.Q(target_user=user)
+        received = models.Q(target_user=user)
+        queryset = self.filter(sent | received)
+        queryset._keyset_branches = (sent, received)
+        return queryset
+
+    def incoming(self) -> "SignalMessageQuerySet":
+        return self.filter(is_incoming=True)
+
+    def outgoing(self) -> "SignalMessageQuerySet":
+        return self.filter(is_incoming=False)
+
+    def since(self, received_at: datetime) -> "SignalMessageQuerySet":
+        return self.filter(received_at__gte=received_at)
+
+    def page(self, limit: int, cursor: Optional[str] = None) -> Tuple[List["SignalMessage"], Optional[str]]:
+        """
+        Return up to `limit` messages, latest first, and the cursor of the next page if any.
+
+        Pages are delimited by the (received_at, id) of their last message rather than by
+        an OFFSET, so fetching a page costs the same wherever it is in the history.
+        """
+        after = decode_cursor(cursor) if cursor is not None else None
+        if self._keyset_branches is None:
+            queryset = self._after(after)
+        else:
+            # UNION ALL of index-ordered scans, merged by the database up to the limit
+            first, *others = [self.filter(branch).order_by()._after(after) for branch in self._keyset_branches]
+            queryset = first.union(*others, all=True)
+
+        messages = list(queryset.order_by("-received_at", "-id")[:limit + 1])
+        if len(messages) <= limit:
+            return messages, None
+
+        messages = messages[:limit]
+        return messages, encode_cursor(messages[-1])
+
+    def _after(self, after: Optional[Tuple[datetime, int]]) -> "SignalMessageQuerySet":
+        if after is None:
+            return self
+
+        received_at, message_id = after
+        return self.filter(
+            received_at__lte=received_at,
+        ).exclude(
+            received_at=received_at,
+            id__gte=message_id,
+        )
+
+
+def encode_cursor(message: "SignalMessage") -> str:
+    return urlsafe_b64encode(f"{message.received_at.isoformat()}|{message.id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        received_at, message_id = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(received_at), int(message_id)
+    except ValueError as error:
+        raise ValueError("Invalid cursor") from error
+
+
+class SignalMessageManager(models.Manager.from_queryset(SignalMessageQuerySet)):
+    def get_queryset(self):
+        # Raw payloads are by far the largest column and are only needed one message at a time
+        return super().get_queryset().defer("compressed_raw_content")
+
+
 class SignalMessage(models.Model):
     class Meta:
+        indexes = [
+            models.Index(fields=["received_at"]),
+            # Conversation history queries, see SignalMessageQuerySet
+            models.Index(fields=["target_group", "received_at", "id"]),
+            models.Index(fields=["target_user", "received_at", "id"]),
+            models.Index(fields=["source_user", "received_at", "id"]),
+        ]
+
         constraints = [
             models.UniqueConstraint(
                 fields=[
@@ -15,6 +122,15 @@ class SignalMessage(models.Model):
                 ],
                 name="unique_together_group_user_received"
             ),
+            # The event key holds the received timestamp, including it keeps the constraint
+            # equivalent while allowing to partition the table by `received_at`
+            models.UniqueConstraint(
+                fields=[
+                    "event_key",
+                    "received_at",
+                ],
+                name="unique_event_key_received"
+            ),
             models.CheckConstraint(
                 check=(
                     models.Q(
@@ -58,8 +174,8 @@ class SignalMessage(models.Model):
         verbose_name="Text content",
     )
 
-    raw_content = models.JSONField(
-        verbose_name="Raw content",
+    compressed_raw_content = models.BinaryField(
+        verbose_name="Compressed raw content",
         null=True
     )
     is_incoming = models.BooleanField(
@@ -68,5 +184,28 @@ class SignalMessage(models.Model):
 
     received_at = models.DateTimeField(verbose_name="Message received at")
 
+    # Idempotency key of incoming messages: (account, source, envelope timestamp)
+    event_key = models.CharField(verbose_name="Event key", max_length=255, null=True)
+
     created_at = models.DateTimeField(verbose_name="Model created at", auto_now_add=True)
     modified_at = models.DateTimeField(verbose_name="Model modified at", auto_now=True)
+
+    objects = SignalMessageManager()
+
+    @property
+    def raw_content(self) -> Optional[Any]:
+        """
+        The raw JSON payload, decompressed on first access and loaded from the database if deferred.
+        """
+        if not hasattr(self, "_raw_content"):
+            compressed_raw_content = self.compressed_raw_content
+            self._raw_content = (
+                None if compressed_raw_content is None
+                else json.loads(zlib.decompress(compressed_raw_content))
+            )
+        return self._raw_content
+
+    @raw_content.setter
+    def raw_content(self, value: Optional[Any]):
+        self._raw_content = value
+        self.compressed_raw_content = None if value is None else zlib.compress(json.dumps(value).encode())
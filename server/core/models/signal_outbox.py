@@ -0,0 +1,97 @@
+from typing import List
+
+from django.db import models
+from django.utils import timezone
+from core.models.signal_group import SignalGroup
+from core.models.signal_user import SignalUser
+
+
+class OutboundMessage(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "available_at"]),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=(
+                    models.Q(
+                        models.Q(
+                            models.Q(target_user__isnull=False) & models.Q(target_group__isnull=True)
+                        )
+                        | models.Q(
+                            models.Q(target_user__isnull=True) & models.Q(target_group__isnull=False)
+                        )
+                    )
+                ),
+                name="outbound_only_one_target_allowed",
+                violation_error_message="Only one of target_group and target_user field can be set"
+            ),
+        ]
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        SENT = "sent", "Sent"
+        FAILED = "failed", "Failed"
+
+    source_user = models.ForeignKey(
+        to=SignalUser,
+        verbose_name="Source User",
+        related_name="outbound_messages",
+        on_delete=models.PROTECT,
+    )
+
+    target_group = models.ForeignKey(
+        to=SignalGroup,
+        verbose_name="Target Group",
+        null=True,
+        related_name="queued_messages",
+        on_delete=models.PROTECT,
+    )
+
+    target_user = models.ForeignKey(
+        to=SignalUser,
+        verbose_name="Target User",
+        null=True,
+        related_name="queued_messages",
+        on_delete=models.PROTECT,
+    )
+
+    text_content = models.TextField(verbose_name="Text content")
+
+    status = models.CharField(
+        verbose_name="Status",
+        max_length=16,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+    attempts = models.PositiveIntegerField(verbose_name="Attempts", default=0)
+    last_error = models.TextField(verbose_name="Last error", blank=True, default="")
+
+    available_at = models.DateTimeField(verbose_name="Available for dispatch at", default=timezone.now)
+    sent_at = models.DateTimeField(verbose_name="Sent at", null=True)
+
+    created_at = models.DateTimeField(verbose_name="Model created at", auto_now_add=True)
+    modified_at = models.DateTimeField(verbose_name="Model modified at", auto_now=True)
+
+    @property
+    def recipient(self) -> SignalUser | SignalGroup:
+        return self.target_user if self.target_user_id is not None else self.target_group
+
+    @classmethod
+    def enqueue(
+        cls,
+        source_user: SignalUser,
+        message: str,
+        recipients: List[SignalUser | SignalGroup],
+    ) -> List["OutboundMessage"]:
+        return cls.objects.bulk_create(
+            [
+                cls(
+                    source_user=source_user,
+                    target_user=recipient if isinstance(recipient, SignalUser) else None,
+                    target_group=recipient if isinstance(recipient, SignalGroup) else None,
+                    text_content=message,
+                )
+                for recipient in recipients
+            ]
+        )
@@ -0,0 +1,62 @@
+import json
+
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimate_row_count(model, using: str = "default") -> int:
+    """
+    Return the planner's estimate of the number of rows of `model`'s table, summing its partitions if any.
+    """
+    table = model._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT COALESCE(SUM(GREATEST(reltuples, 0)), 0)::bigint FROM pg_class"
+            " WHERE oid = %s::regclass"
+            " OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass)",
+            [table, table],
+        )
+        return cursor.fetchone()[0]
+
+
+def estimate_queryset_count(queryset) -> int:
+    """
+    Return the planner's estimate of the number of rows of `queryset`, from its `EXPLAIN`.
+    """
+    try:
+        sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+    except EmptyResultSet:
+        return 0
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator counting querysets from the planner's statistics instead of a `COUNT(*)`:
+    `pg_class.reltuples` for unfiltered querysets, the `EXPLAIN` estimate for filtered ones.
+
+    Querysets estimated smaller than `estimate_threshold` are counted exactly, as
+    are querysets on other databases than PostgreSQL.
+    """
+
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self) -> int:
+        query = getattr(self.object_list, "query", None)
+        if query is not None and connections[self.object_list.db].vendor == "postgresql":
+            if query.where:
+                estimate = estimate_queryset_count(self.object_list)
+            else:
+                estimate = estimate_row_count(self.object_list.model, using=self.object_list.db)
+            if estimate >= self.estimate_threshold:
+                return estimate
+
+        return super().count
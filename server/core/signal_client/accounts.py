@@ -0,0 +1,71 @@
+import logging
+import threading
+import time
+from typing import FrozenSet, Optional
+
+from django.conf import settings
+
+from core.signal_client.transport import SignalTransport
+
+logger = logging.getLogger("SignalClient")
+
+
+class RegisteredAccountsCache:
+    """
+    Process-wide TTL cache of the accounts registered in signal-cli (`listAccounts`).
+
+    Once loaded, an expired cache keeps serving the previous accounts while a
+    background thread refreshes it, so callers never wait on signal-cli.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._accounts: Optional[FrozenSet[str]] = None
+        self._fetched_at: float = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self, transport: SignalTransport) -> FrozenSet[str]:
+        accounts = self._accounts
+        if accounts is None:
+            return self.refresh(transport)
+
+        if time.monotonic() - self._fetched_at > self.ttl_seconds:
+            self._refresh_in_background(transport)
+
+        return accounts
+
+    def refresh(self, transport: SignalTransport) -> FrozenSet[str]:
+        accounts = frozenset(
+            account["number"]
+            for account in transport.call("listAccounts")
+        )
+        with self._lock:
+            self._accounts = accounts
+            self._fetched_at = time.monotonic()
+        return accounts
+
+    def invalidate(self):
+        with self._lock:
+            self._accounts = None
+            self._fetched_at = 0.0
+
+    def _refresh_in_background(self, transport: SignalTransport):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.refresh(transport)
+            except Exception:
+                logger.warning("Failed to refresh registered accounts", exc_info=True)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=refresh, name="signal-accounts-refresh", daemon=True).start()
+
+
+registered_accounts = RegisteredAccountsCache(ttl_seconds=settings.SIGNAL_ACCOUNTS_CACHE_TTL_SECONDS)
@@ -1,207 +1,300 @@
 import logging
 from datetime import datetime
-import re
-from uuid import uuid4
-from typing import Any, Collection, Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from typing import Any, Collection, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 
 import requests
 from django.conf import settings
-from django.db.transaction import atomic
+from django.core.exceptions import ImproperlyConfigured
 from django.utils import timezone
 
 from core.models.signal_group import SignalGroup
 from core.models.signal_message import SignalMessage
 from core.models.signal_user import SignalUser
-from core.signal_client.utils import utf16_len
+from core.signal_client.accounts import registered_accounts
+from core.signal_client.envelopes import persist_events
+from core.signal_client.styles import StyledMessage, parse_message_style
+from core.signal_client.transport import SignalRPCError, SignalTransport, get_transport
 
 logger = logging.getLogger("SignalClient")
 
-STYLE_CHAR = {
-    "*": "ITALIC",
-    "#": "BOLD",
-    "~": "STRIKETHROUGH",
-    "|": "SPOILER",
-    "_": "MONOSPACE",
-}
+
+class SendResult(NamedTuple):
+    recipient: SignalUser | SignalGroup
+    signal_message: Optional[SignalMessage]
+    error: Optional[Exception]
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
 
 
 class SignalClient:
-    def __init__(self, signal_user: SignalUser):
-        self.url: str = settings.SIGNAL_URL.rstrip("/")
+    def __init__(self, signal_user: SignalUser, transport: Optional[SignalTransport] = None):
+        self.transport: SignalTransport = transport if transport is not None else get_transport()
+        self.url: str = self.transport.url
         self.headers = {
             "Content-Type": "application/json",
             "Accept": "application/json",
         }
 
-        accounts_request = requests.post(
-            self.url + "/api/v1/rpc",
-            timeout=settings.REQUESTS_TIMEOUT_SECONDS,
-            json={
-                "jsonrpc": "2.0",
-                "method": "listAccounts",
-                "id": str(uuid4())
-            }
-        )
-        accounts_request.raise_for_status()
-        remote_registered_accounts = [
-            account["number"]
-            for account in accounts_request.json()["result"]
-        ]
+        remote_registered_accounts = registered_accounts.get(self.transport)
+        if signal_user.source_number not in remote_registered_accounts:
+            # The account may have been registered since the cache was last filled
+            remote_registered_accounts = registered_accounts.refresh(self.transport)
         if signal_user.source_number not in remote_registered_accounts:
             raise ValueError("Provided user is not registered in the signal client")
 
         if not signal_user.is_registered:
             signal_user.is_registered = True
-            signal_user.save(update_fields=["can_send_message"])
+            signal_user.save(update_fields=["is_registered"])
 
         self.user = signal_user
 
-    def receive_messages(self) -> Collection[SignalMessage]:
-        raise NotImplementedError("")
-        response = requests.get(
-            self.url + "/v1/receive/" + self.user.source_number,
-            params={
-                "send_read_receipts": "false",
-            },
-            timeout=settings.REQUESTS_TIMEOUT_SECONDS,
-            headers=self.headers,
-        )
-        response.raise_for_status()
-
-        respons_data: List[Dict[str, Any]] = response.json()
-        user_infos: Dict[str, Dict[str, Any]] = dict()
-
-        if len(respons_data) > 0:
-            with atomic():
-                messages_to_create: List[SignalMessage] = []
-                for item in respons_data:
-                    envelope = item.get("envelope")
-                    if envelope is None or "dataMessage" not in envelope.keys():
-                        logger.info(
-                            "Received a non-data message",
-                            extra=item,
-                        )
-                        continue
-                    message: Dict[str, Any] = envelope["dataMessage"]
-                    messages_to_create.append(
-                        SignalMessage(
-                            target_group_id=message.get("groupInfo", {}).get("groupId"),
-                            target_user_id=self.user,
-                            source_user=envelope["sourceNumber"],
-                            text_content=message["message"],
-                            raw_content=item,
-                            received_at=datetime.fromtimestamp(message["timestamp"] / 1000, timezone.utc),
-                            is_incoming=True,
-                        )
-                    )
+    def receive_messages(self, chunk_size: Optional[int] = None) -> int:
+        """
+        Drain the messages received by the account, storing them by chunks of `chunk_size`
+        events so that memory stays flat whatever the backlog.
 
-                    user_infos.setdefault(
-                        envelope["sourceNumber"],
-                        {
-                            "source_name": envelope["sourceName"],
-                            "display_name": envelope["sourceName"],
-                            "is_registered": False,
-                        }
-                    )
+        Return the number of new messages submitted to the database, see persist_events: a message
+        stored concurrently by another process is still counted, the database ignoring it.
+        """
+        chunk_size = chunk_size if chunk_size is not None else settings.SIGNAL_RECEIVE_CHUNK_SIZE
+        events = self.iter_received_events(chunk_size)
 
-                signal_users_numbers = set(
-                    SignalUser.objects.filter(
-                        source_number__in=user_infos.keys(),
-                    ).values_list(
-                        "source_number",
-                        flat=True,
-                    )
+        new_count = 0
+        while len(chunk := list(islice(events, chunk_size))) > 0:
+            new_count += len(persist_events(chunk))
+
+        return new_count
+
+    def iter_received_events(self, max_messages: int) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the events pending in signal-cli for the account, fetching them `max_messages` at a time.
+
+        Raise ImproperlyConfigured unless signal-cli runs with `--receive-mode=manual`: by default it
+        pushes the received messages to its event stream, which sse-client or consume_signal_events store.
+        """
+        while True:
+            try:
+                received: List[Dict[str, Any]] = self.transport.call(
+                    "receive",
+                    {
+                        "account": self.user.source_number,
+                        "timeout": 1,
+                        "maxMessages": max_messages,
+                    },
+                ) or []
+            except SignalRPCError as error:
+                if error.is_receive_mode_error:
+                    raise ImproperlyConfigured(
+                        "signal-cli delivers the received messages on its event stream, stored by sse-client or"
+                        " consume_signal_events. Run it with --receive-mode=manual to receive them on demand."
+                    ) from error
+                raise
+            if len(received) == 0:
+                return
+
+            for item in received:
+                if "envelope" in item:
+                    yield {"account": self.user.source_number, **item}
+                else:
+                    yield {"account": self.user.source_number, "envelope": item}
+
+    def send_message(self, message: str | StyledMessage, recipients: List[SignalUser | SignalGroup]) -> Collection[SignalMessage]:
+        """
+        Send `message` to all `recipients` with one multi-recipient `send` for the users
+        and one for the groups, whatever the number of recipients.
+        """
+        message_content, message_styles = SignalClient.parse_message_style(message)
+        users = [recipient for recipient in recipients if isinstance(recipient, SignalUser)]
+        groups = [recipient for recipient in recipients if isinstance(recipient, SignalGroup)]
+
+        signal_messages: List[SignalMessage] = []
+        for recipients_chunk in (users, groups):
+            if len(recipients_chunk) == 0:
+                continue
+            self._send(self._build_send_payload(message_content, message_styles, recipients_chunk))
+            # Each row keeps the payload of its own recipient, the shared one lists all of them
+            signal_messages.extend(
+                self._build_signal_message(
+                    message,
+                    recipient,
+                    self._build_send_payload(message_content, message_styles, [recipient]),
                 )
-                user_numbers_to_create = set(user_infos.keys()).difference(signal_users_numbers)
+                for recipient in recipients_chunk
+            )
 
-                if len(user_numbers_to_create) > 0:
-                    users_to_create: List[SignalUser] = []
-                    for user_number in user_numbers_to_create:
-                        users_to_create.append(
-                            SignalUser(
-                                source_number=user_number,
-                                **user_infos[user_number]
-                            )
-                        )
+        return SignalMessage.objects.bulk_create(signal_messages)
 
-                    SignalUser.objects.bulk_create(users_to_create)
+    def fan_out_message(
+        self,
+        message: str | StyledMessage,
+        recipients: List[SignalUser | SignalGroup],
+        concurrency: Optional[int] = None,
+    ) -> List["SendResult"]:
+        """
+        Send `message` to every recipient concurrently, with at most `concurrency` requests in flight.
 
-                return SignalMessage.objects.bulk_create(messages_to_create)
-        return []
+        A failing recipient does not abort the others: one SendResult is returned per recipient,
+        in the order of `recipients`, and only the successful sends are persisted.
+        """
+        if len(recipients) == 0:
+            return []
 
-    def send_message(self, message: str, recipients: List[SignalUser | SignalGroup]) -> Collection[SignalMessage]:
+        concurrency = concurrency if concurrency is not None else settings.SIGNAL_FAN_OUT_CONCURRENCY
         message_content, message_styles = SignalClient.parse_message_style(message)
-        for recipient in recipients:
-            recipient_id = recipient.source_number if isinstance(recipient, SignalUser) else recipient.signal_id
-            request_payload = {
-                "jsonrpc": "2.0",
-                "method": "send",
-                "params": {
-                    "message": message_content,
-                    "text-style": message_styles,
-                    "recipient": [recipient_id],
-                    "account": self.user.source_number,
-                },
-                "id": str(uuid4()),
+
+        def send_to(recipient: SignalUser | SignalGroup) -> Dict[str, Any]:
+            request_payload = self._build_send_payload(message_content, message_styles, [recipient])
+            self._send(request_payload)
+            return request_payload
+
+        request_payloads: Dict[int, Dict[str, Any]] = {}
+        errors: Dict[int, Exception] = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(recipients)))) as executor:
+            futures = {
+                executor.submit(send_to, recipient): index
+                for index, recipient in enumerate(recipients)
             }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    request_payloads[index] = future.result()
+                except (requests.RequestException, SignalRPCError) as error:
+                    logger.warning(
+                        "Failed to send message to recipient",
+                        exc_info=error,
+                    )
+                    errors[index] = error
 
-            response = requests.post(
-                url=self.url + "/api/v1/rpc",
-                timeout=settings.REQUESTS_TIMEOUT_SECONDS,
-                json=request_payload,
+        sent_indexes = sorted(request_payloads.keys())
+        signal_messages = SignalMessage.objects.bulk_create(
+            [
+                self._build_signal_message(message, recipients[index], request_payloads[index])
+                for index in sent_indexes
+            ]
+        )
+        signal_messages_by_index = dict(zip(sent_indexes, signal_messages))
+
+        return [
+            SendResult(
+                recipient=recipient,
+                signal_message=signal_messages_by_index.get(index),
+                error=errors.get(index),
             )
-            response.raise_for_status()
+            for index, recipient in enumerate(recipients)
+        ]
 
-        return SignalMessage.objects.bulk_create(
-            [
-                SignalMessage(
-                    target_group=recipient if isinstance(recipient, SignalGroup) else None,
-                    target_user=recipient if isinstance(recipient, SignalUser) else None,
-                    source_user=self.user,
-                    text_content=message,
-                    raw_content=request_payload,
-                    received_at=datetime.now(tz=timezone.utc),
-                    is_incoming=False,
+    def send_batch(
+        self,
+        outgoing: Iterable[Tuple[str | StyledMessage, Sequence[SignalUser | SignalGroup]]],
+        batch_size: Optional[int] = None,
+    ) -> List[SendResult]:
+        """
+        Send many `(message, recipients)` pairs packed into JSON-RPC batch requests
+        of at most `batch_size` sends each.
+
+        One SendResult is returned per (message, recipient) pair, in order, and all
+        the successful sends are persisted with a single bulk_create.
+        """
+        batch_size = batch_size if batch_size is not None else settings.SIGNAL_BATCH_SIZE
+
+        pending: List[Tuple[str, SignalUser | SignalGroup, Dict[str, Any]]] = []
+        for message, recipients in outgoing:
+            message_content, message_styles = SignalClient.parse_message_style(message)
+            for recipient in recipients:
+                pending.append(
+                    (message, recipient, self._build_send_payload(message_content, message_styles, [recipient]))
                 )
-                for recipient in recipients
+
+        errors: Dict[int, Exception] = {}
+        for chunk_start in range(0, len(pending), batch_size):
+            chunk = pending[chunk_start:chunk_start + batch_size]
+            try:
+                chunk_results = self.transport.call_batch(
+                    [("send", request_payload) for _message, _recipient, request_payload in chunk]
+                )
+            except (requests.RequestException, SignalRPCError) as error:
+                logger.warning("Failed to send message batch", exc_info=error)
+                chunk_results = [error] * len(chunk)
+
+            for offset, result in enumerate(chunk_results):
+                if isinstance(result, Exception):
+                    errors[chunk_start + offset] = result
+                    if isinstance(result, SignalRPCError) and result.is_account_error:
+                        registered_accounts.invalidate()
+
+        sent_indexes = [index for index in range(len(pending)) if index not in errors]
+        signal_messages = SignalMessage.objects.bulk_create(
+            [
+                self._build_signal_message(*pending[index])
+                for index in sent_indexes
             ]
         )
+        signal_messages_by_index = dict(zip(sent_indexes, signal_messages))
 
-    @staticmethod
-    def parse_message_style(message):
-        pattern = r'(\*[^*]+\*|#[^#]+#|~[^~]+~|\|[^\|]+\||_[^_]+\_)'
-        matches = re.findall(pattern, message)
-        style_to_content_tuples = []
-        last_end = 0
-        for match in matches:
-            start = message.find(match, last_end)
-            end = start + len(match)
-
-            if start > last_end:
-                style_to_content_tuples.append(("PLAIN", message[last_end:start]))
-
-            style_char = match[0]
-            style = STYLE_CHAR[style_char]
-
-            style_to_content_tuples.append((style, match[1:-1]))  # Remove the style characters
-            last_end = end
-
-        if last_end < len(message):
-            style_to_content_tuples.append(("PLAIN", message[last_end:]))
-
-        style_directives: List[str] = []
-        text_content = ""
-        current_index = 0
-        for style, content in style_to_content_tuples:
-            if style != "PLAIN":
-                style_directives.append(
-                    f"{current_index}:{utf16_len(content)}:{style}"
-                )
+        return [
+            SendResult(
+                recipient=recipient,
+                signal_message=signal_messages_by_index.get(index),
+                error=errors.get(index),
+            )
+            for index, (_message, recipient, _request_payload) in enumerate(pending)
+        ]
+
+    def _send(self, request_payload: Dict[str, Any]) -> Any:
+        try:
+            return self.transport.call("send", request_payload)
+        except SignalRPCError as error:
+            if error.is_account_error:
+                registered_accounts.invalidate()
+            raise
 
-            current_index += utf16_len(content)
-            text_content = text_content + content
+    def _build_send_payload(
+        self,
+        message_content: str,
+        message_styles: Sequence[str],
+        recipients: Sequence[SignalUser | SignalGroup],
+    ) -> Dict[str, Any]:
+        request_payload: Dict[str, Any] = {
+            "message": message_content,
+            "text-style": message_styles,
+            "account": self.user.source_number,
+        }
 
-        return (
-            text_content,
-            style_directives
+        user_numbers = [recipient.source_number for recipient in recipients if isinstance(recipient, SignalUser)]
+        if len(user_numbers) > 0:
+            request_payload["recipient"] = user_numbers
+
+        group_ids = [recipient.signal_id for recipient in recipients if isinstance(recipient, SignalGroup)]
+        if len(group_ids) > 0:
+            request_payload["group-id"] = group_ids
+
+        return request_payload
+
+    def _build_signal_message(
+        self,
+        message: str | StyledMessage,
+        recipient: SignalUser | SignalGroup,
+        request_payload: Dict[str, Any],
+    ) -> SignalMessage:
+        return SignalMessage(
+            target_group=recipient if isinstance(recipient, SignalGroup) else None,
+            target_user=recipient if isinstance(recipient, SignalUser) else None,
+            source_user=self.user,
+            text_content=message.text if isinstance(message, StyledMessage) else message,
+            raw_content=request_payload,
+            received_at=datetime.now(tz=timezone.utc),
+            is_incoming=False,
         )
+
+    @staticmethod
+    def parse_message_style(message: str | StyledMessage) -> StyledMessage:
+        """
+        Parse the style markers of `message`, messages rendered from a MessageTemplate are already parsed.
+        """
+        if isinstance(message, StyledMessage):
+            return message
+        return parse_message_style(message)
@@ -0,0 +1,177 @@
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from django.conf import settings
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from core import metrics
+from core.models.signal_group import SignalGroup
+from core.models.signal_message import SignalMessage
+from core.models.signal_user import SignalUser
+
+logger = logging.getLogger("SignalClient")
+
+
+class RecentKeys:
+    """
+    Thread-safe LRU set of the latest stored event keys, dropping duplicates before they reach the database.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._keys: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._keys:
+                return False
+            self._keys.move_to_end(key)
+            return True
+
+    def add_all(self, keys: Iterable[str]):
+        with self._lock:
+            for key in keys:
+                self._keys[key] = None
+                self._keys.move_to_end(key)
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+
+
+recent_event_keys = RecentKeys(max_size=settings.INGESTION_DEDUP_CACHE_SIZE)
+
+
+def is_valid_event(event: Any) -> bool:
+    return isinstance(event, dict) and isinstance(event.get("envelope"), dict)
+
+
+def event_key(event: Dict[str, Any]) -> str:
+    envelope: Dict[str, Any] = event["envelope"]
+    return f"{event.get('account')}:{envelope.get('sourceNumber') or envelope.get('sourceUuid')}:{envelope.get('timestamp')}"
+
+
+def message_from_event(event: Dict[str, Any]) -> Optional[SignalMessage]:
+    """
+    Build the SignalMessage of a signal-cli event, or None if it does not hold a storable text message.
+    """
+    envelope: Dict[str, Any] = event["envelope"]
+    data_message: Optional[Dict[str, Any]] = envelope.get("dataMessage")
+    if data_message is None or data_message.get("message") is None or envelope.get("sourceNumber") is None:
+        return None
+
+    group_id = (data_message.get("groupInfo") or {}).get("groupId")
+    if group_id is None and event.get("account") is None:
+        # A direct message has to be stored with its recipient, the receiving account
+        logger.warning("Dropping a direct message without account", extra={"event": event})
+        return None
+
+    return SignalMessage(
+        target_group_id=group_id,
+        target_user_id=event.get("account") if group_id is None else None,
+        source_user_id=envelope["sourceNumber"],
+        text_content=data_message["message"],
+        raw_content=event,
+        received_at=datetime.fromtimestamp(data_message["timestamp"] / 1000, timezone.utc),
+        is_incoming=True,
+        event_key=event_key(event),
+    )
+
+
+def persist_events(events: Iterable[Dict[str, Any]]) -> List[SignalMessage]:
+    """
+    Store the text messages of signal-cli `events`, creating their unknown senders and recipients
+    and updating the name of the known senders.
+
+    Messages already stored and messages of unknown groups are skipped. Duplicates are
+    first looked up in memory then in the database, and counted for each of both layers.
+
+    Return the messages inserted with `ON CONFLICT DO NOTHING`, which does not tell the
+    inserted rows: a duplicate stored concurrently by another process is returned too.
+    """
+    messages_to_create: List[SignalMessage] = []
+    senders: Dict[str, SignalUser] = dict()
+    recipients: Dict[str, SignalUser] = dict()
+    batch_keys: Set[str] = set()
+    for event in events:
+        message = message_from_event(event)
+        if message is None:
+            logger.info("Received a non-data message", extra={"event": event})
+            continue
+        if message.event_key in batch_keys or message.event_key in recent_event_keys:
+            metrics.increment("ingestion.duplicates.memory")
+            continue
+        batch_keys.add(message.event_key)
+        messages_to_create.append(message)
+
+        source_name = event["envelope"].get("sourceName") or ""
+        # The latest name of a sender wins
+        senders[message.source_user_id] = SignalUser(
+            source_number=message.source_user_id,
+            source_name=source_name,
+            display_name=source_name,
+            is_registered=False,
+        )
+        if message.target_user_id is not None:
+            recipients.setdefault(
+                message.target_user_id,
+                SignalUser(
+                    source_number=message.target_user_id,
+                    source_name=message.target_user_id,
+                    display_name=message.target_user_id,
+                    is_registered=False,
+                )
+            )
+
+    if len(messages_to_create) == 0:
+        return []
+
+    stored_keys = set(
+        SignalMessage.objects.filter(
+            event_key__in=batch_keys,
+        ).values_list(
+            "event_key",
+            flat=True,
+        )
+    )
+    if len(stored_keys) > 0:
+        metrics.increment("ingestion.duplicates.database", len(stored_keys))
+        messages_to_create = [message for message in messages_to_create if message.event_key not in stored_keys]
+
+    group_ids = {message.target_group_id for message in messages_to_create if message.target_group_id is not None}
+    if len(group_ids) > 0:
+        known_group_ids = set(
+            SignalGroup.objects.filter(
+                internal_id__in=group_ids,
+            ).values_list(
+                "internal_id",
+                flat=True,
+            )
+        )
+        if known_group_ids != group_ids:
+            logger.warning("Dropping messages of unknown groups", extra={"group_ids": group_ids - known_group_ids})
+            messages_to_create = [
+                message
+                for message in messages_to_create
+                if message.target_group_id is None or message.target_group_id in known_group_ids
+            ]
+
+    with atomic():
+        SignalUser.objects.bulk_create(
+            senders.values(),
+            update_conflicts=True,
+            update_fields=["source_name"],
+            unique_fields=["source_number"],
+        )
+        SignalUser.objects.bulk_create(
+            [user for number, user in recipients.items() if number not in senders],
+            ignore_conflicts=True,
+        )
+        created_messages = SignalMessage.objects.bulk_create(messages_to_create, ignore_conflicts=True)
+
+    # Only remembered once stored, so that a failed batch can be retried
+    recent_event_keys.add_all(batch_keys)
+    return created_messages
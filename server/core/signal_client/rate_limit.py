@@ -0,0 +1,75 @@
+from typing import List, NamedTuple
+
+from django.conf import settings
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from core.models.rate_limit import RateLimitBucket
+from core.models.signal_group import SignalGroup
+from core.models.signal_user import SignalUser
+
+
+class RateLimit(NamedTuple):
+    key: str
+    rate_per_second: float
+    burst: float
+
+
+def account_limit(account: SignalUser) -> RateLimit:
+    return RateLimit(
+        key=f"account:{account.source_number}",
+        rate_per_second=settings.SIGNAL_ACCOUNT_RATE_PER_SECOND,
+        burst=settings.SIGNAL_ACCOUNT_RATE_BURST,
+    )
+
+
+def recipient_limit(recipient: SignalUser | SignalGroup) -> RateLimit:
+    recipient_id = recipient.source_number if isinstance(recipient, SignalUser) else recipient.signal_id
+    return RateLimit(
+        key=f"recipient:{recipient_id}",
+        rate_per_second=settings.SIGNAL_RECIPIENT_RATE_PER_SECOND,
+        burst=settings.SIGNAL_RECIPIENT_RATE_BURST,
+    )
+
+
+def acquire(limits: List[RateLimit]) -> float:
+    """
+    Take one token from every bucket of `limits`, or none of them.
+
+    The buckets are rows locked with SELECT ... FOR UPDATE, so every worker process
+    sharing the database shares them. Return 0 when the tokens were taken, otherwise
+    the number of seconds to wait before all the buckets have a token again.
+    """
+    keys = sorted({limit.key for limit in limits})
+
+    with atomic():
+        RateLimitBucket.objects.bulk_create(
+            [
+                RateLimitBucket(key=limit.key, tokens=limit.burst, updated_at=timezone.now())
+                for limit in limits
+            ],
+            ignore_conflicts=True,
+        )
+        # Locking in key order so that two workers can never deadlock on the same buckets
+        buckets = {
+            bucket.key: bucket
+            for bucket in RateLimitBucket.objects.select_for_update().filter(key__in=keys).order_by("key")
+        }
+
+        now = timezone.now()
+        wait_seconds = 0.0
+        for limit in limits:
+            bucket = buckets[limit.key]
+            elapsed_seconds = max(0.0, (now - bucket.updated_at).total_seconds())
+            bucket.tokens = min(limit.burst, bucket.tokens + elapsed_seconds * limit.rate_per_second)
+            bucket.updated_at = now
+            if bucket.tokens < 1:
+                wait_seconds = max(wait_seconds, (1 - bucket.tokens) / limit.rate_per_second)
+
+        if wait_seconds == 0:
+            for bucket in buckets.values():
+                bucket.tokens -= 1
+
+        RateLimitBucket.objects.bulk_update(buckets.values(), fields=["tokens", "updated_at"])
+
+    return wait_seconds
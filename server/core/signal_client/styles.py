@@ -0,0 +1,94 @@
+import re
+from functools import lru_cache
+from itertools import accumulate
+from typing import Dict, List, NamedTuple, Tuple
+
+from core.signal_client.utils import utf16_offsets
+
+STYLE_CHAR = {
+    "*": "ITALIC",
+    "#": "BOLD",
+    "~": "STRIKETHROUGH",
+    "|": "SPOILER",
+    "_": "MONOSPACE",
+}
+
+# A backslash escaping a marker or another backslash, or a style marker
+TOKEN_PATTERN = re.compile(r"\\([\\*#~|_])|([*#~|_])")
+
+
+class StyledMessage(NamedTuple):
+    text: str
+    styles: Tuple[str, ...]
+
+
+@lru_cache(maxsize=512)
+def parse_message_style(message: str) -> StyledMessage:
+    """
+    Strip the style markers of `message` and compute the matching signal-cli
+    `start:length:STYLE` directives, with offsets in UTF-16 code units.
+
+    Styles can be nested (`#bold *and italic*#`), markers can be escaped with a
+    backslash (`\\*`) and unclosed or crossing markers are kept as plain text.
+    The message is scanned once, and results are cached since alerts are often
+    sent many times.
+    """
+    text, ranges = parse_style_ranges(message)
+
+    boundaries = utf16_offsets(text, [boundary for start, end, _style in ranges for boundary in (start, end)])
+    return StyledMessage(
+        text=text,
+        styles=tuple(
+            f"{start}:{end - start}:{style}"
+            for start, end, (_start, _end, style) in zip(boundaries[::2], boundaries[1::2], ranges)
+            if end > start
+        ),
+    )
+
+
+def parse_style_ranges(message: str) -> Tuple[str, List[Tuple[int, int, str]]]:
+    """
+    Strip the style markers of `message` and return the resulting text along with
+    the `(start, end, STYLE)` ranges of each style, in code point offsets.
+    """
+    # [plain, escaped, marker, plain, ..., escaped, marker, plain], token `i` being
+    # parts[3 * i + 1] or parts[3 * i + 2], between plains[i] and plains[i + 1]
+    parts = TOKEN_PATTERN.split(message)
+    plains, markers = parts[0::3], parts[2::3]
+
+    # First pass: pair each opening marker with the next marker of the same kind,
+    # styles have to be nested, markers opened inside a closed style are plain text
+    open_markers: List[int] = []
+    depth_by_marker: Dict[str, int] = dict()
+    closer_by_opener: Dict[int, int] = dict()
+    for index, marker in enumerate(markers):
+        if marker is None:
+            continue
+        depth = depth_by_marker.get(marker)
+        if depth is None:
+            depth_by_marker[marker] = len(open_markers)
+            open_markers.append(index)
+            continue
+
+        opener = open_markers[depth]
+        for unclosed in open_markers[depth:]:
+            del depth_by_marker[markers[unclosed]]
+        del open_markers[depth:]
+        if opener == index - 1 and plains[index] == "":
+            # No content between both markers: the first one is plain text
+            depth_by_marker[marker] = len(open_markers)
+            open_markers.append(index)
+        else:
+            closer_by_opener[opener] = index
+
+    # Second pass: paired markers are dropped from the text, escaped characters lose their backslash
+    for opener, closer in closer_by_opener.items():
+        parts[3 * opener + 2] = parts[3 * closer + 2] = ""
+    parts = ["" if part is None else part for part in parts]
+
+    # Code point offset of the end of each part, a paired marker's offset is where its style starts or ends
+    ends = list(accumulate(map(len, parts)))
+    return "".join(parts), [
+        (ends[3 * opener + 2], ends[3 * closer + 2], STYLE_CHAR[markers[opener]])
+        for opener, closer in sorted(closer_by_opener.items())
+    ]
@@ -0,0 +1,91 @@
+import string
+from bisect import bisect_left
+from typing import Any, List, Optional, Tuple
+
+from core.signal_client.styles import StyledMessage, parse_style_ranges
+from core.signal_client.utils import utf16_len, utf16_offsets
+
+# Private use area characters standing for the template fields while the styles are parsed
+FIELD_PLACEHOLDER_START = 0xE000
+
+
+class MessageTemplate:
+    """
+    A message with style markers and `str.format` fields whose styles are parsed only once.
+
+        template = MessageTemplate("#Alert# for _{city}_: {temperature:.1f}°C")
+        text, styles = template.render(city="Paris", temperature=31.4)
+
+    Field values are inserted as plain text, style markers they contain are not interpreted.
+    """
+
+    formatter = string.Formatter()
+
+    def __init__(self, template: str):
+        self.template = template
+
+        self.fields: List[Tuple[str, Optional[str], str]] = []
+        marked_parts: List[str] = []
+        for literal_text, field_name, format_spec, conversion in self.formatter.parse(template):
+            marked_parts.append(literal_text)
+            if field_name is None:
+                continue
+            if field_name == "" or field_name[0].isdigit():
+                raise ValueError("Template fields must be named")
+            marked_parts.append(chr(FIELD_PLACEHOLDER_START + len(self.fields)))
+            self.fields.append((field_name, conversion, format_spec))
+
+        text, ranges = parse_style_ranges("".join(marked_parts))
+
+        # Text between fields, each placeholder being a single character
+        self.literals: List[str] = []
+        placeholder_positions: List[int] = []
+        last_end = 0
+        for position, char in enumerate(text):
+            if FIELD_PLACEHOLDER_START <= ord(char) < FIELD_PLACEHOLDER_START + len(self.fields):
+                self.literals.append(text[last_end:position])
+                placeholder_positions.append(position)
+                last_end = position + 1
+        self.literals.append(text[last_end:])
+
+        # Each style boundary is stored as its UTF-16 offset within the literal text
+        # plus the number of fields rendered before it
+        positions = [boundary for start, end, _style in ranges for boundary in (start, end)]
+        fields_before = [bisect_left(placeholder_positions, position) for position in positions]
+        self.boundaries: List[Tuple[int, int]] = [
+            (utf16_offset - field_count, field_count)
+            for utf16_offset, field_count in zip(utf16_offsets(text, positions), fields_before)
+        ]
+        self.styles: List[str] = [style for _start, _end, style in ranges]
+
+    def render(self, **values: Any) -> StyledMessage:
+        rendered_fields: List[str] = []
+        for field_name, conversion, format_spec in self.fields:
+            value, _key = self.formatter.get_field(field_name, (), values)
+            if "{" in format_spec:
+                format_spec = self.formatter.vformat(format_spec, (), values)
+            rendered_fields.append(
+                self.formatter.format_field(self.formatter.convert_field(value, conversion), format_spec)
+            )
+
+        fields_utf16_offsets = [0]
+        for rendered_field in rendered_fields:
+            fields_utf16_offsets.append(fields_utf16_offsets[-1] + utf16_len(rendered_field))
+
+        pieces: List[str] = [self.literals[0]]
+        for rendered_field, literal in zip(rendered_fields, self.literals[1:]):
+            pieces.append(rendered_field)
+            pieces.append(literal)
+
+        boundaries = [
+            literal_offset + fields_utf16_offsets[field_count]
+            for literal_offset, field_count in self.boundaries
+        ]
+        return StyledMessage(
+            text="".join(pieces),
+            styles=tuple(
+                f"{start}:{end - start}:{style}"
+                for start, end, style in zip(boundaries[::2], boundaries[1::2], self.styles)
+                if end > start
+            ),
+        )
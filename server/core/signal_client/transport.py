@@ -0,0 +1,180 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class SignalRPCError(Exception):
+    def __init__(self, code: Optional[int], message: str, data: Any = None):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+        self.data = data
+
+    @property
+    def is_account_error(self) -> bool:
+        message = self.message.lower()
+        return "account" in message or "not registered" in message
+
+    @property
+    def is_receive_mode_error(self) -> bool:
+        # Raised by `receive` unless signal-cli runs with `--receive-mode=manual`
+        return "already being received" in self.message.lower()
+
+
+class SignalTransport:
+    """
+    Pooled keep-alive HTTP transport to the signal-cli JSON-RPC endpoint.
+
+    A single instance is meant to be shared by every SignalClient of a process,
+    see `get_transport`.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        pool_size: int = 10,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeout: float = 30.0,
+    ):
+        self.url: str = url.rstrip("/")
+        self.rpc_url: str = self.url + "/api/v1/rpc"
+        self.timeout = timeout
+
+        # `send` is not idempotent: only retry when the request never reached
+        # signal-cli (connection errors) or when the proxy answered it was unavailable.
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            status=max_retries,
+            status_forcelist=(502, 503),
+            allowed_methods=None,
+            backoff_factor=backoff_factor,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+        )
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        })
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post(self, payload: Dict[str, Any] | List[Dict[str, Any]]) -> Any:
+        response = self.session.post(
+            self.rpc_url,
+            timeout=self.timeout,
+            json=payload,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def call(self, method: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        payload: Dict[str, Any] = {
+            "jsonrpc": "2.0",
+            "method": method,
+            "id": str(uuid4()),
+        }
+        if params is not None:
+            payload["params"] = params
+
+        response_data = self.post(payload)
+        if "error" in response_data:
+            error = response_data["error"]
+            raise SignalRPCError(error.get("code"), error.get("message", ""), error.get("data"))
+
+        return response_data.get("result")
+
+    def call_batch(self, calls: List[Tuple[str, Optional[Dict[str, Any]]]]) -> List[Any | SignalRPCError]:
+        """
+        Send many `(method, params)` calls in a single JSON-RPC 2.0 batch request.
+
+        Responses are matched back to their call by id: the returned list is aligned with
+        `calls` and holds either the call result or the SignalRPCError it failed with.
+        """
+        if len(calls) == 0:
+            return []
+
+        payload: List[Dict[str, Any]] = []
+        for method, params in calls:
+            request_object: Dict[str, Any] = {
+                "jsonrpc": "2.0",
+                "method": method,
+                "id": str(uuid4()),
+            }
+            if params is not None:
+                request_object["params"] = params
+            payload.append(request_object)
+
+        response_data = self.post(payload)
+        if isinstance(response_data, dict):
+            # The batch as a whole was rejected
+            error = response_data.get("error", {})
+            raise SignalRPCError(error.get("code"), error.get("message", ""), error.get("data"))
+
+        responses_by_id: Dict[str, Dict[str, Any]] = {
+            response["id"]: response
+            for response in response_data
+            if response.get("id") is not None
+        }
+
+        results: List[Any | SignalRPCError] = []
+        for request_object in payload:
+            response = responses_by_id.get(request_object["id"])
+            if response is None:
+                results.append(SignalRPCError(None, "No response received for this request"))
+            elif "error" in response:
+                error = response["error"]
+                results.append(SignalRPCError(error.get("code"), error.get("message", ""), error.get("data")))
+            else:
+                results.append(response.get("result"))
+
+        return results
+
+    def close(self):
+        self.session.close()
+
+
+_transport: Optional[SignalTransport] = None
+_transport_pid: Optional[int] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> SignalTransport:
+    """
+    Return the transport shared by the current process, creating it on first use.
+
+    The pid is checked so that a transport created before a fork (e.g. gunicorn preload)
+    is never shared with the child processes.
+    """
+    global _transport, _transport_pid
+
+    pid = os.getpid()
+    if _transport is not None and _transport_pid == pid:
+        return _transport
+
+    with _transport_lock:
+        if _transport is None or _transport_pid != pid:
+            _transport = SignalTransport(
+                url=settings.SIGNAL_URL,
+                pool_size=settings.SIGNAL_POOL_SIZE,
+                max_retries=settings.SIGNAL_MAX_RETRIES,
+                backoff_factor=settings.SIGNAL_RETRY_BACKOFF_SECONDS,
+                timeout=settings.REQUESTS_TIMEOUT_SECONDS,
+            )
+            _transport_pid = pid
+
+    return _transport
@@ -1,3 +1,10 @@
+import re
+from bisect import bisect_left
+from typing import Iterable, List
+
+ASTRAL_CHARACTERS = re.compile("[\U00010000-\U0010FFFF]")
+
+
 def utf16_len(text):
     """
     Calculate the length of a Python string in UTF-16 code units.
@@ -5,9 +12,43 @@ def utf16_len(text):
     :param text: The original string.
     :return: The length of the string in UTF-16 code units.
     """
-    utf16_length = 0
+    if text.isascii():
+        return len(text)
+
+    try:
+        # Characters outside the BMP take two code units, encoding is done in C
+        return len(text.encode("utf-16-le")) // 2
+    except UnicodeEncodeError:
+        # Lone surrogates go through the codec's error handler one by one, counting is faster
+        return len(text) + len(ASTRAL_CHARACTERS.findall(text))
+
+
+def utf16_offsets(text: str, offsets: Iterable[int]) -> List[int]:
+    """
+    Convert code point offsets of a string to UTF-16 code unit offsets.
+
+    Prefixes are never rescanned, whatever the number of offsets.
+
+    :param text: The original string.
+    :param offsets: Code point offsets in `text`, in any order.
+    :return: The UTF-16 offsets, in the same order as `offsets`.
+    """
+    offsets = list(offsets)
+    if text.isascii():
+        return offsets
+
+    # Only characters outside the BMP take two code units: either find them all,
+    # or measure the slices between consecutive offsets, whichever is fewer
+    if utf16_len(text) - len(text) < len(offsets):
+        astral_positions = [match.start() for match in ASTRAL_CHARACTERS.finditer(text)]
+        return [offset + bisect_left(astral_positions, offset) for offset in offsets]
 
-    for char in text:
-        utf16_length += 1 if ord(char) < 65536 else 2
+    utf16_by_offset = dict()
+    previous_offset = 0
+    previous_utf16_offset = 0
+    for offset in sorted(set(offsets)):
+        previous_utf16_offset += utf16_len(text[previous_offset:offset])
+        previous_offset = offset
+        utf16_by_offset[offset] = previous_utf16_offset
 
-    return utf16_length
+    return [utf16_by_offset[offset] for offset in offsets]
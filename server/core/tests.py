@@ -1,3 +1,1233 @@
-from django.test import TestCase
+import io
+import json
+import random
+import re
+import threading
+import time
+import timeit
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, tag
+from django.utils import timezone
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from core.ingestion import EventBuffer
+from core.management.commands.consume_signal_events import Command as ConsumeSignalEventsCommand
+from core.management.commands.dispatch_outbox import Command as DispatchOutboxCommand
+from core.management.commands.partition_signal_messages import Command as PartitionSignalMessagesCommand
+from core.models.signal_group import SignalGroup
+from core.models.rate_limit import RateLimitBucket
+from core.models.signal_message import SignalMessage, encode_cursor
+from core.models.signal_outbox import OutboundMessage
+from core.models.signal_user import SignalUser
+from core.signal_client import rate_limit
+from core.signal_client.accounts import RegisteredAccountsCache, registered_accounts
+from core.signal_client.client import SignalClient
+from core.signal_client.envelopes import persist_events
+from core.signal_client.styles import STYLE_CHAR, parse_message_style, parse_style_ranges
+from core.signal_client.template import MessageTemplate
+from core.signal_client.transport import SignalRPCError, SignalTransport
+from core.signal_client.utils import utf16_len, utf16_offsets
+
+
+def reference_utf16_len(text: str) -> int:
+    # Previous per-character implementation
+    utf16_length = 0
+    for char in text:
+        utf16_length += 1 if ord(char) < 65536 else 2
+    return utf16_length
+
+
+ALPHABETS = {
+    "ascii": [chr(code) for code in range(0, 128)],
+    "bmp": [chr(code) for code in range(0, 0xD800, 97)] + ["é", "€", "中"],
+    "astral": ["a", "é", "😀", "👍", chr(0x1F3FD), chr(0x10FFFF)],
+    "lone surrogates": ["a", "\ud83d", "\ude00", "\udfff", "😀"],
+}
+
+
+def random_text(rng: random.Random, alphabet, max_length: int = 64, min_length: int = 0) -> str:
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(min_length, max_length)))
+
+
+def reference_parse_message_style(message: str):
+    # Previous implementation, without nesting nor escapes
+    pattern = r'(\*[^*]+\*|#[^#]+#|~[^~]+~|\|[^\|]+\||_[^_]+\_)'
+    matches = re.findall(pattern, message)
+    style_to_content_tuples = []
+    last_end = 0
+    for match in matches:
+        start = message.find(match, last_end)
+        end = start + len(match)
+        if start > last_end:
+            style_to_content_tuples.append(("PLAIN", message[last_end:start]))
+        style_to_content_tuples.append((STYLE_CHAR[match[0]], match[1:-1]))
+        last_end = end
+    if last_end < len(message):
+        style_to_content_tuples.append(("PLAIN", message[last_end:]))
+
+    style_directives = []
+    text_content = ""
+    current_index = 0
+    for style, content in style_to_content_tuples:
+        if style != "PLAIN":
+            style_directives.append(f"{current_index}:{reference_utf16_len(content)}:{style}")
+        current_index += reference_utf16_len(content)
+        text_content = text_content + content
+    return text_content, style_directives
+
+
+def random_styled_message(rng: random.Random, length: int) -> str:
+    # Plain words and styled spans, never nested
+    words = ["alert", "wind", "42", "km/h", "😀", "température", "pluie"]
+    pieces = []
+    while sum(len(piece) for piece in pieces) < length:
+        word = " ".join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+        marker = rng.choice([None, *STYLE_CHAR])
+        pieces.append(word if marker is None else f"{marker}{word}{marker}")
+    return " ".join(pieces)
+
+
+class EventBufferTestCase(SimpleTestCase):
+    def setUp(self):
+        self.persisted = []
+        self.flushed = threading.Event()
+
+        def persist_events(events):
+            self.persisted.append(list(events))
+            self.flushed.set()
+
+        patcher = mock.patch("core.ingestion.persist_events", side_effect=persist_events)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_flushes_after_interval(self):
+        buffer = EventBuffer(flush_events=500, flush_interval_seconds=0.05, max_events=1000, retry_max_seconds=1)
+
+        buffer.push([{"envelope": {"timestamp": 1}}])
+        self.assertTrue(self.flushed.wait(timeout=2))
+        self.assertEqual(self.persisted, [[{"envelope": {"timestamp": 1}}]])
+
+        # Once drained, the flusher waits idle and a new event starts a new interval
+        self.flushed.clear()
+        buffer.push([{"envelope": {"timestamp": 2}}])
+        self.assertTrue(self.flushed.wait(timeout=2))
+        self.assertEqual(self.persisted[-1], [{"envelope": {"timestamp": 2}}])
+        self.assertEqual(buffer.depth, 0)
+
+    def test_flushes_when_full(self):
+        buffer = EventBuffer(flush_events=2, flush_interval_seconds=60, max_events=10, retry_max_seconds=1)
+
+        buffer.push([{"envelope": {"timestamp": 1}}, {"envelope": {"timestamp": 2}}])
+        self.assertTrue(self.flushed.wait(timeout=2))
+        self.assertEqual(len(self.persisted[0]), 2)
+
+    def test_retries_batch_when_database_is_unavailable(self):
+        buffer = EventBuffer(flush_events=2, flush_interval_seconds=0.2, max_events=3, retry_max_seconds=1)
+        failures = [OperationalError("connection refused")]
+
+        def persist_events(events):
+            if len(failures) > 0:
+                raise failures.pop()
+            self.persisted.append(list(events))
+            self.flushed.set()
+
+        with mock.patch("core.ingestion.persist_events", side_effect=persist_events), \
+                self.assertLogs("core.ingestion", "ERROR"):
+            buffer.push([{"envelope": {"timestamp": 1}}, {"envelope": {"timestamp": 2}}])
+            # The failed batch is put back at the head of the buffer, counting towards its capacity
+            for _ in range(100):
+                if len(failures) == 0 and buffer.depth == 2:
+                    break
+                time.sleep(0.01)
+            self.assertTrue(buffer.push([{"envelope": {"timestamp": 3}}]))
+            self.assertFalse(buffer.push([{"envelope": {"timestamp": 4}}]))
+
+            self.assertTrue(self.flushed.wait(timeout=2))
+        self.assertEqual(self.persisted[0], [{"envelope": {"timestamp": 1}}, {"envelope": {"timestamp": 2}}])
+
+    def test_drops_batch_on_other_errors(self):
+        buffer = EventBuffer(flush_events=500, flush_interval_seconds=60, max_events=10, retry_max_seconds=1)
+        buffer.push([{"envelope": {"timestamp": 1}}])
+
+        with mock.patch("core.ingestion.persist_events", side_effect=ValueError), self.assertLogs("core.ingestion"):
+            self.assertTrue(buffer.flush())
+        self.assertEqual(buffer.depth, 0)
+
+    def test_rejects_events_over_capacity(self):
+        buffer = EventBuffer(flush_events=500, flush_interval_seconds=60, max_events=1, retry_max_seconds=1)
+
+        self.assertFalse(buffer.push([{"envelope": {}}, {"envelope": {}}]))
+        self.assertEqual(buffer.depth, 0)
+
+
+def make_event_stream_response(body: bytes) -> requests.Response:
+    # As built by requests' HTTPAdapter, the encoding comes from the Content-Type header
+    response = requests.Response()
+    response.status_code = 200
+    response.headers = CaseInsensitiveDict({"Content-Type": "text/event-stream"})
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.raw = io.BytesIO(body)
+    return response
+
+
+class ConsumeSignalEventsTestCase(SimpleTestCase):
+    def read_events(self, body: bytes):
+        command = ConsumeSignalEventsCommand(stdout=io.StringIO(), stderr=io.StringIO())
+        command.last_event_id = None
+        session = mock.Mock(spec=requests.Session)
+        session.get.return_value = make_event_stream_response(body)
+        return command, list(command.read_events(session, read_timeout=1))
+
+    def test_decodes_utf8_events(self):
+        event = {"envelope": {"sourceName": "Zoé 😀", "dataMessage": {"message": "Température élevée"}}}
+        body = f"id: 7\ndata: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        command, events = self.read_events(body)
+
+        self.assertEqual(events, [event])
+        self.assertEqual(command.last_event_id, "7")
+
+    def test_joins_data_lines_and_skips_comments(self):
+        command, events = self.read_events(b': keep-alive\n\ndata: {"a":\ndata: 1}\n\ndata: nope\n\n')
+
+        self.assertEqual(events, [{"a": 1}])
+        self.assertIsNone(command.last_event_id)
+
+
+def make_event(timestamp: int, account=None, group_id=None):
+    data_message = {"timestamp": timestamp, "message": f"message {timestamp}"}
+    if group_id is not None:
+        data_message["groupInfo"] = {"groupId": group_id}
+    event = {
+        "envelope": {
+            "sourceNumber": "+33600000001",
+            "sourceName": "Sender",
+            "timestamp": timestamp,
+            "dataMessage": data_message,
+        },
+    }
+    if account is not None:
+        event["account"] = account
+    return event
+
+
+class PersistEventsTestCase(TestCase):
+    def test_stores_direct_messages_once(self):
+        event = make_event(1_700_000_000_000, account="+33600000002")
+        self.assertEqual(len(persist_events([event, event])), 1)
+        self.assertEqual(len(persist_events([make_event(1_700_000_000_000, account="+33600000002")])), 0)
+
+        message = SignalMessage.objects.get()
+        self.assertEqual(message.target_user_id, "+33600000002")
+        self.assertEqual(message.source_user.source_name, "Sender")
+
+    def test_skips_direct_messages_without_account(self):
+        # Without its recipient, the message would break the target constraint of the whole batch
+        with self.assertLogs("SignalClient", "WARNING"):
+            persist_events([
+                make_event(1_700_000_001_000),
+                make_event(1_700_000_002_000, account="+33600000002"),
+            ])
+
+        self.assertEqual(
+            list(SignalMessage.objects.values_list("text_content", flat=True)),
+            ["message 1700000002000"],
+        )
+
+
+class FakeTransport:
+    """
+    Stand-in for SignalTransport answering each call with `handlers[method](params)` and recording it.
+    """
+
+    url = "http://signal-cli"
+
+    def __init__(self, accounts=("+33600000009",), **handlers):
+        self.calls = []
+        self.handlers = {"listAccounts": lambda params: [{"number": number} for number in accounts], **handlers}
+
+    def call(self, method, params=None):
+        self.calls.append((method, params))
+        return self.handlers[method](params)
+
+    def call_batch(self, calls):
+        results = []
+        for method, params in calls:
+            try:
+                results.append(self.call(method, params))
+            except SignalRPCError as error:
+                results.append(error)
+        return results
+
+    def calls_of(self, method):
+        return [params for called_method, params in self.calls if called_method == method]
+
+
+class RegisteredAccountsCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("core.signal_client.accounts.time.monotonic", new=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.accounts = ["+33600000009"]
+        self.release = threading.Event()
+        self.release.set()
+
+        def list_accounts(params):
+            self.assertTrue(self.release.wait(timeout=2))
+            return [{"number": number} for number in self.accounts]
+
+        self.transport = FakeTransport(listAccounts=list_accounts)
+        self.cache = RegisteredAccountsCache(ttl_seconds=60)
+
+    def wait_for_refresh(self):
+        for _ in range(200):
+            if not self.cache._refreshing:
+                return
+            time.sleep(0.01)
+        self.fail("The background refresh did not end")
+
+    def test_serves_cached_accounts_until_expiry(self):
+        self.assertEqual(self.cache.get(self.transport), {"+33600000009"})
+        self.accounts.append("+33600000010")
+
+        self.now += 60
+        self.assertEqual(self.cache.get(self.transport), {"+33600000009"})
+        self.assertEqual(len(self.transport.calls), 1)
+
+    def test_refreshes_expired_accounts_once_in_background(self):
+        self.cache.get(self.transport)
+        self.accounts.append("+33600000010")
+        self.release.clear()
+
+        self.now += 61
+        # Expired accounts are still served while a single refresh runs
+        self.assertEqual(self.cache.get(self.transport), {"+33600000009"})
+        self.assertEqual(self.cache.get(self.transport), {"+33600000009"})
+        self.release.set()
+        self.wait_for_refresh()
+
+        self.assertEqual(len(self.transport.calls), 2)
+        self.assertEqual(self.cache.get(self.transport), {"+33600000009", "+33600000010"})
+
+    def test_failed_background_refresh_is_retried(self):
+        self.cache.get(self.transport)
+        self.transport.handlers["listAccounts"] = mock.Mock(side_effect=requests.ConnectionError)
+
+        self.now += 61
+        with self.assertLogs("SignalClient", "WARNING") as logs:
+            self.assertEqual(self.cache.get(self.transport), {"+33600000009"})
+            self.wait_for_refresh()
+            self.cache.get(self.transport)
+            self.wait_for_refresh()
+
+        self.assertEqual(len(logs.records), 2)
+
+        self.assertEqual(self.transport.handlers["listAccounts"].call_count, 2)
+
+    def test_invalidate_fetches_on_next_get(self):
+        self.cache.get(self.transport)
+        self.accounts.append("+33600000010")
+        self.cache.invalidate()
+
+        self.assertEqual(self.cache.get(self.transport), {"+33600000009", "+33600000010"})
+        self.assertEqual(len(self.transport.calls), 2)
+
+
+class SignalClientTestCase(TestCase):
+    def setUp(self):
+        registered_accounts.invalidate()
+        self.addCleanup(registered_accounts.invalidate)
+        self.bot = SignalUser.objects.create(source_number="+33600000009", source_name="Bot", display_name="Bot")
+
+    def test_refreshes_accounts_missing_from_cache(self):
+        registered_accounts.refresh(FakeTransport(accounts=()))
+
+        transport = FakeTransport()
+        SignalClient(self.bot, transport=transport)
+        self.assertEqual(transport.calls_of("listAccounts"), [None])
+
+        self.bot.refresh_from_db()
+        self.assertTrue(self.bot.is_registered)
+
+        # Cached accounts are not fetched again
+        SignalClient(self.bot, transport=transport)
+        self.assertEqual(len(transport.calls), 1)
+
+    def test_rejects_unregistered_account(self):
+        with self.assertRaises(ValueError):
+            SignalClient(self.bot, transport=FakeTransport(accounts=("+33600000001",)))
+
+    def test_receive_messages_by_chunks(self):
+        received = [
+            [make_event(1_700_000_010_000), make_event(1_700_000_011_000)],
+            [make_event(1_700_000_012_000), make_event(1_700_000_010_000)],
+            [{"sourceNumber": "+33600000001", "timestamp": 1, "typingMessage": {}}],
+            [],
+        ]
+        transport = FakeTransport(receive=lambda params: received.pop(0))
+        client = SignalClient(self.bot, transport=transport)
+
+        # The duplicate and the typing notification are not counted
+        self.assertEqual(client.receive_messages(chunk_size=2), 3)
+        self.assertEqual(
+            [params["maxMessages"] for params in transport.calls_of("receive")],
+            [2, 2, 2, 2],
+        )
+        self.assertEqual(
+            set(SignalMessage.objects.values_list("target_user_id", flat=True)),
+            {"+33600000009"},
+        )
+
+    def test_send_message_once_per_recipient_kind(self):
+        users = SignalUser.objects.bulk_create([
+            SignalUser(source_number=f"+3360000010{index}", source_name="User", display_name="User")
+            for index in range(3)
+        ])
+        group = SignalGroup.objects.create(name="Group", signal_id="group=", internal_id="group", owner=self.bot)
+        transport = FakeTransport(send=lambda params: {"timestamp": 1})
+        client = SignalClient(self.bot, transport=transport)
+
+        signal_messages = client.send_message("*Alert*", [users[0], group, users[1], users[2]])
+
+        self.assertEqual(
+            [(params.get("recipient"), params.get("group-id")) for params in transport.calls_of("send")],
+            [([user.source_number for user in users], None), (None, ["group="])],
+        )
+        self.assertEqual(len(signal_messages), 4)
+        # Stored payloads stay the same size whatever the number of recipients
+        self.assertEqual(
+            [
+                (message.raw_content.get("recipient"), message.raw_content.get("group-id"))
+                for message in signal_messages
+            ],
+            [([user.source_number], None) for user in users] + [(None, ["group="])],
+        )
+        self.assertEqual(signal_messages[0].raw_content["text-style"], ("0:5:ITALIC",))
+
+    def test_receive_messages_outside_manual_mode(self):
+        def receive(params):
+            raise SignalRPCError(-1, "Receive command cannot be used if messages are already being received.")
+
+        client = SignalClient(self.bot, transport=FakeTransport(receive=receive))
+        with self.assertRaises(ImproperlyConfigured):
+            client.receive_messages()
+
+
+class FakeClock:
+    def __init__(self, now: datetime):
+        self.now = now
+        self.slept = 0.0
+
+    def monotonic(self) -> float:
+        return self.slept
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    def advance(self, seconds: float):
+        self.now += timedelta(seconds=seconds)
+        self.slept += seconds
+
+
+def answer_batch(payload, fail=(), skip=()):
+    # Responses in reverse order, the calls whose recipient is in `fail` failing and the ones in `skip` unanswered
+    responses = []
+    for request_object in reversed(payload):
+        recipient = request_object["params"]["recipient"][0]
+        if recipient in skip:
+            continue
+        if recipient in fail:
+            responses.append({"jsonrpc": "2.0", "id": request_object["id"], "error": {"code": -1, "message": "Failed"}})
+        else:
+            responses.append({"jsonrpc": "2.0", "id": request_object["id"], "result": {"timestamp": 1}})
+    return responses
+
+
+class SignalTransportBatchTestCase(SimpleTestCase):
+    def setUp(self):
+        self.transport = SignalTransport("http://signal-cli")
+        self.addCleanup(self.transport.close)
+
+    def call_batch(self, recipients, post):
+        with mock.patch.object(self.transport, "post", side_effect=post) as patched_post:
+            results = self.transport.call_batch([("send", {"recipient": [recipient]}) for recipient in recipients])
+        return results, patched_post
+
+    def test_matches_reordered_responses_by_id(self):
+        def post(payload):
+            self.assertEqual(len({request_object["id"] for request_object in payload}), 3)
+            return [
+                {"jsonrpc": "2.0", "id": request_object["id"], "result": request_object["params"]["recipient"]}
+                for request_object in reversed(payload)
+            ]
+
+        results, _post = self.call_batch(["+1", "+2", "+3"], post)
+        self.assertEqual(results, [["+1"], ["+2"], ["+3"]])
+
+    def test_missing_and_failed_responses(self):
+        results, _post = self.call_batch(
+            ["+1", "+2", "+3"],
+            lambda payload: answer_batch(payload, fail={"+1"}, skip={"+3"}),
+        )
+
+        self.assertIsInstance(results[0], SignalRPCError)
+        self.assertEqual((results[0].code, results[0].message), (-1, "Failed"))
+        self.assertEqual(results[1], {"timestamp": 1})
+        self.assertIsInstance(results[2], SignalRPCError)
+        self.assertIsNone(results[2].code)
+
+    def test_rejected_batch(self):
+        with self.assertRaises(SignalRPCError) as context:
+            self.call_batch(
+                ["+1"],
+                lambda payload: {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Invalid Request"}},
+            )
+        self.assertEqual(context.exception.code, -32600)
+
+    def test_empty_batch_is_not_sent(self):
+        results, post = self.call_batch([], lambda payload: [])
+        self.assertEqual(results, [])
+        post.assert_not_called()
+
+
+class SignalClientSendBatchTestCase(TestCase):
+    def setUp(self):
+        registered_accounts.invalidate()
+        self.addCleanup(registered_accounts.invalidate)
+        self.bot = SignalUser.objects.create(source_number="+33600000009", source_name="Bot", display_name="Bot")
+        self.users = SignalUser.objects.bulk_create([
+            SignalUser(source_number=f"+3360000010{index}", source_name="User", display_name="User")
+            for index in range(5)
+        ])
+        self.client = SignalClient(self.bot, transport=FakeTransport())
+
+    def send_batch(self, call_batch):
+        with mock.patch.object(self.client.transport, "call_batch", side_effect=call_batch) as patched_call_batch:
+            results = self.client.send_batch(
+                [("first", self.users[:3]), ("second", self.users[3:])],
+                batch_size=2,
+            )
+        return results, patched_call_batch
+
+    def test_results_are_aligned_with_sends(self):
+        def call_batch(calls):
+            return [
+                SignalRPCError(-1, "Unregistered user") if params["recipient"] == [self.users[1].source_number] else {}
+                for _method, params in calls
+            ]
+
+        results, call_batch = self.send_batch(call_batch)
+
+        self.assertEqual([len(calls) for (calls,), _kwargs in call_batch.call_args_list], [2, 2, 1])
+        self.assertEqual([result.recipient for result in results], self.users)
+        self.assertEqual([result.ok for result in results], [True, False, True, True, True])
+        self.assertEqual(
+            list(SignalMessage.objects.order_by("id").values_list("target_user_id", "text_content")),
+            [
+                (self.users[0].source_number, "first"),
+                (self.users[2].source_number, "first"),
+                (self.users[3].source_number, "second"),
+                (self.users[4].source_number, "second"),
+            ],
+        )
+
+    def test_rejected_batch_fails_its_sends_only(self):
+        batches = [None, SignalRPCError(-32600, "Invalid Request"), None]
+
+        def call_batch(calls):
+            error = batches.pop(0)
+            if error is not None:
+                raise error
+            return [{} for _call in calls]
+
+        with self.assertLogs("SignalClient", "WARNING"):
+            results, _call_batch = self.send_batch(call_batch)
+
+        self.assertEqual([result.ok for result in results], [True, True, False, False, True])
+        self.assertEqual(results[2].error.code, -32600)
+        self.assertEqual(SignalMessage.objects.count(), 3)
+
+    def test_account_error_invalidates_registered_accounts(self):
+        with mock.patch.object(registered_accounts, "invalidate") as invalidate:
+            self.send_batch(lambda calls: [SignalRPCError(-1, "User is not registered.") for _call in calls])
+        invalidate.assert_called()
+
+
+class RateLimitTestCase(TestCase):
+    def setUp(self):
+        self.clock = FakeClock(datetime(2026, 1, 1, tzinfo=dt_timezone.utc))
+        patcher = mock.patch("django.utils.timezone.now", new=lambda: self.clock.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tokens(self, key: str) -> float:
+        return RateLimitBucket.objects.get(key=key).tokens
+
+    def test_takes_burst_then_waits_for_refill(self):
+        limit = rate_limit.RateLimit(key="account", rate_per_second=2, burst=2)
+
+        self.assertEqual(rate_limit.acquire([limit]), 0)
+        self.assertEqual(rate_limit.acquire([limit]), 0)
+        self.assertAlmostEqual(rate_limit.acquire([limit]), 0.5)
+
+        self.clock.advance(0.25)
+        self.assertAlmostEqual(rate_limit.acquire([limit]), 0.25)
+        self.clock.advance(0.25)
+        self.assertEqual(rate_limit.acquire([limit]), 0)
+
+    def test_refill_is_capped_by_burst(self):
+        limit = rate_limit.RateLimit(key="account", rate_per_second=1, burst=3)
+        rate_limit.acquire([limit])
+
+        self.clock.advance(3600)
+        rate_limit.acquire([limit])
+        self.assertAlmostEqual(self.tokens("account"), 2)
+
+    def test_takes_all_tokens_or_none(self):
+        account = rate_limit.RateLimit(key="account", rate_per_second=1, burst=5)
+        recipient = rate_limit.RateLimit(key="recipient", rate_per_second=0.5, burst=1)
+
+        self.assertEqual(rate_limit.acquire([account, recipient]), 0)
+        # The recipient is empty, so no token of the account is taken either
+        self.assertAlmostEqual(rate_limit.acquire([account, recipient]), 2)
+        self.assertAlmostEqual(self.tokens("account"), 4)
+        self.assertAlmostEqual(self.tokens("recipient"), 0)
+
+        # The longest wait of all the buckets is returned
+        self.clock.advance(1)
+        self.assertAlmostEqual(rate_limit.acquire([account, recipient]), 1)
+
+
+@override_settings(SIGNAL_RATE_LIMIT_MAX_WAIT_SECONDS=2)
+class DispatchOutboxThrottleTestCase(TestCase):
+    def setUp(self):
+        self.clock = FakeClock(datetime(2026, 1, 1, tzinfo=dt_timezone.utc))
+        for target, new in (
+            ("django.utils.timezone.now", lambda: self.clock.now),
+            ("core.management.commands.dispatch_outbox.time", self.clock),
+        ):
+            patcher = mock.patch(target, new=new)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        bot = SignalUser(source_number="+33600000009", source_name="Bot", display_name="Bot")
+        self.messages = [
+            OutboundMessage(
+                source_user=bot,
+                target_user=SignalUser(source_number=f"+3360000010{index}", source_name="User", display_name="User"),
+                text_content="message",
+            )
+            for index in range(4)
+        ]
+
+    def test_total_wait_is_capped(self):
+        waits = [0, 1.5, 0, 1.5, 0, 1.5, 1.5]
+        with mock.patch("core.signal_client.rate_limit.acquire", side_effect=waits):
+            allowed = DispatchOutboxCommand().throttle(self.messages, max_total_wait_seconds=3.5)
+
+        # The third wait would exceed the batch budget, its message and the next ones are requeued
+        self.assertEqual(allowed, self.messages[:3])
+        self.assertEqual(self.clock.slept, 3)
+        self.assertEqual(self.messages[3].available_at, self.clock.now + timedelta(seconds=1.5))
+
+    def test_long_waits_are_requeued(self):
+        with mock.patch("core.signal_client.rate_limit.acquire", side_effect=[0, 5, 0, 0]):
+            allowed = DispatchOutboxCommand().throttle(self.messages, max_total_wait_seconds=150)
+
+        self.assertEqual(allowed, [self.messages[0], self.messages[2], self.messages[3]])
+        self.assertEqual(self.clock.slept, 0)
+
+
+class DispatchOutboxTestCase(TestCase):
+    def setUp(self):
+        registered_accounts.invalidate()
+        self.addCleanup(registered_accounts.invalidate)
+        self.bot = SignalUser.objects.create(source_number="+33600000009", source_name="Bot", display_name="Bot")
+        self.alice, self.bob = SignalUser.objects.bulk_create([
+            SignalUser(source_number=number, source_name=name, display_name=name)
+            for number, name in (("+33600000011", "Alice"), ("+33600000012", "Bob"))
+        ])
+        self.group = SignalGroup.objects.create(name="Group", signal_id="group=", internal_id="group", owner=self.bot)
+
+        self.leases = []
+
+        def send(params):
+            # The claimed rows are leased while they are sent
+            leased = OutboundMessage.objects.filter(available_at__gt=timezone.now())
+            self.leases.extend(leased.values_list("id", flat=True))
+            if params.get("recipient") == [self.bob.source_number]:
+                raise SignalRPCError(-1, "Failed to send message")
+            return {"timestamp": 1}
+
+        self.transport = FakeTransport(send=send)
+        patcher = mock.patch(
+            "core.management.commands.dispatch_outbox.SignalClient",
+            new=lambda user: SignalClient(user, transport=self.transport),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def dispatch(self):
+        call_command("dispatch_outbox", "--once", "--max-attempts=2", stdout=io.StringIO(), stderr=io.StringIO())
+
+    def make_available(self, outbound_message: OutboundMessage):
+        OutboundMessage.objects.filter(id=outbound_message.id).update(available_at=timezone.now())
+
+    def test_dispatch_retry_and_failure(self):
+        to_alice, to_bob, to_group = OutboundMessage.enqueue(self.bot, "Alert", [self.alice, self.bob, self.group])
+
+        started_at = timezone.now()
+        self.dispatch()
+        for outbound_message in (to_alice, to_bob, to_group):
+            outbound_message.refresh_from_db()
+
+        self.assertEqual(
+            [(message.status, message.attempts, message.last_error) for message in (to_alice, to_group)],
+            [(OutboundMessage.Status.SENT, 1, "")] * 2,
+        )
+        self.assertEqual(SignalMessage.objects.filter(is_incoming=False).count(), 2)
+        self.assertCountEqual(self.leases, [to_alice.id, to_bob.id, to_group.id] * 3)
+
+        # The failed send is retried after a backoff
+        self.assertEqual(
+            (to_bob.status, to_bob.attempts, to_bob.last_error),
+            (OutboundMessage.Status.PENDING, 1, "-1: Failed to send message"),
+        )
+        self.assertGreaterEqual(to_bob.available_at, started_at + timedelta(seconds=2))
+        self.dispatch()
+        self.assertEqual(len(self.transport.calls_of("send")), 3)
+
+        self.make_available(to_bob)
+        self.dispatch()
+        to_bob.refresh_from_db()
+        self.assertEqual((to_bob.status, to_bob.attempts), (OutboundMessage.Status.FAILED, 2))
+
+        # Failed messages are never dispatched again
+        self.make_available(to_bob)
+        self.dispatch()
+        self.assertEqual(len(self.transport.calls_of("send")), 4)
+
+    def test_leased_messages_are_skipped_until_the_lease_ends(self):
+        outbound_message, = OutboundMessage.enqueue(self.bot, "Alert", [self.alice])
+        # Claimed by a worker that died before sending it
+        OutboundMessage.objects.update(available_at=timezone.now() + timedelta(seconds=300))
+
+        self.dispatch()
+        self.assertEqual(self.transport.calls_of("send"), [])
+
+        self.make_available(outbound_message)
+        self.dispatch()
+        outbound_message.refresh_from_db()
+        self.assertEqual(outbound_message.status, OutboundMessage.Status.SENT)
+
+
+class SignalMessageRawContentTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = SignalUser.objects.create(source_number="+33600000011", source_name="Alice", display_name="Alice")
+
+    def create_message(self, raw_content) -> SignalMessage:
+        return SignalMessage.objects.create(
+            source_user=self.user,
+            target_user=self.user,
+            text_content="Température élevée 😀",
+            raw_content=raw_content,
+            is_incoming=True,
+            received_at=datetime(2026, 1, 1, tzinfo=dt_timezone.utc),
+        )
+
+    def test_round_trip(self):
+        raw_content = {"envelope": {"sourceName": "Zoé 😀", "dataMessage": {"message": "a" * 2000}}, "account": None}
+        message = self.create_message(raw_content)
+        self.assertLess(len(message.compressed_raw_content), 200)
+
+        self.assertEqual(SignalMessage.objects.get(id=message.id).raw_content, raw_content)
+        self.assertIsNone(SignalMessage.objects.get(id=self.create_message(None).id).raw_content)
+
+    def test_raw_content_is_loaded_on_access(self):
+        message_id = self.create_message({"envelope": {"timestamp": 1}}).id
+
+        message = SignalMessage.objects.get(id=message_id)
+        self.assertEqual(message.get_deferred_fields(), {"compressed_raw_content"})
+        with self.assertNumQueries(1):
+            self.assertEqual(message.raw_content, {"envelope": {"timestamp": 1}})
+        with self.assertNumQueries(0):
+            message.raw_content
+
+    def test_assigned_raw_content_is_saved(self):
+        message = SignalMessage.objects.get(id=self.create_message(None).id)
+        message.raw_content = ["updated"]
+        message.save()
+
+        self.assertEqual(SignalMessage.objects.get(id=message.id).raw_content, ["updated"])
+
+
+class CompressRawContentMigrationTestCase(TransactionTestCase):
+    before = [("core", "0006_alter_signalmessage_event_key_and_more")]
+    after = [("core", "0007_signalmessage_compressed_raw_content")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_compresses_and_restores_raw_content(self):
+        apps = self.migrate(self.before)
+        user = apps.get_model("core", "SignalUser").objects.create(
+            source_number="+33600000011",
+            source_name="Alice",
+            display_name="Alice",
+        )
+        raw_contents = [{"envelope": {"timestamp": index, "sourceName": "Zoé 😀"}} for index in range(3)] + [None]
+        apps.get_model("core", "SignalMessage").objects.bulk_create([
+            apps.get_model("core", "SignalMessage")(
+                source_user=user,
+                target_user=user,
+                text_content="message",
+                raw_content=raw_content,
+                is_incoming=True,
+                received_at=datetime(2026, 1, 1, tzinfo=dt_timezone.utc) + timedelta(seconds=index),
+            )
+            for index, raw_content in enumerate(raw_contents)
+        ])
+
+        apps = self.migrate(self.after)
+        self.assertEqual(
+            [
+                None if compressed is None else json.loads(zlib.decompress(compressed))
+                for compressed in apps.get_model("core", "SignalMessage").objects.order_by(
+                    "received_at"
+                ).values_list(
+                    "compressed_raw_content",
+                    flat=True,
+                )
+            ],
+            raw_contents,
+        )
+
+        apps = self.migrate(self.before)
+        self.assertEqual(
+            list(apps.get_model("core", "SignalMessage").objects.order_by("received_at").values_list(
+                "raw_content",
+                flat=True,
+            )),
+            raw_contents,
+        )
+
+
+class SignalMessageHistoryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob, cls.carol = SignalUser.objects.bulk_create([
+            SignalUser(source_number=number, source_name=name, display_name=name)
+            for number, name in (("+33600000011", "Alice"), ("+33600000012", "Bob"), ("+33600000013", "Carol"))
+        ])
+        cls.group = SignalGroup.objects.create(name="Group", signal_id="group", internal_id="group", owner=cls.alice)
+
+        started_at = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        targets = [
+            (cls.alice, cls.bob, None),
+            (cls.bob, cls.alice, None),
+            (cls.alice, None, cls.group),
+            (cls.carol, cls.alice, None),
+            (cls.alice, cls.alice, None),  # Note to self
+            (cls.carol, cls.bob, None),
+            (cls.alice, cls.carol, None),
+        ]
+        cls.messages = SignalMessage.objects.bulk_create([
+            SignalMessage(
+                source_user=source_user,
+                target_user=target_user,
+                target_group=target_group,
+                text_content=f"message {index}",
+                is_incoming=source_user != cls.alice,
+                received_at=started_at + timedelta(minutes=index),
+            )
+            for index, (source_user, target_user, target_group) in enumerate(targets)
+        ])
+
+    def read_all_pages(self, queryset, limit: int):
+        pages = []
+        cursor = None
+        while True:
+            messages, cursor = queryset.page(limit, cursor)
+            pages.append([message.text_content for message in messages])
+            if cursor is None:
+                return pages
+
+    def test_pages_with_user_in_both_directions(self):
+        self.assertEqual(
+            self.read_all_pages(SignalMessage.objects.with_user(self.alice), limit=2),
+            [["message 6", "message 4"], ["message 3", "message 1"], ["message 0"]],
+        )
+
+    def test_with_user_chains_filters(self):
+        queryset = SignalMessage.objects.with_user(self.alice).incoming()
+        self.assertEqual(self.read_all_pages(queryset, limit=10), [["message 3", "message 1"]])
+        self.assertEqual(queryset.count(), 2)
+
+    def test_pages_group_history(self):
+        self.assertEqual(
+            self.read_all_pages(SignalMessage.objects.in_group(self.group), limit=1),
+            [["message 2"]],
+        )
+        self.assertEqual(
+            self.read_all_pages(SignalMessage.objects.from_user(self.carol), limit=1),
+            [["message 5"], ["message 3"]],
+        )
+
+
+class FakeCursor:
+    """
+    Record the executed statements and return the scripted results in order.
+    """
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append(" ".join(sql.split()))
+
+    def fetchone(self):
+        return self.results.pop(0)
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+
+class PartitionSignalMessagesTestCase(TestCase):
+    def make_command(self, results) -> PartitionSignalMessagesCommand:
+        command = PartitionSignalMessagesCommand(stdout=io.StringIO(), stderr=io.StringIO())
+        command.table = "core_signalmessage"
+        command.cursor = FakeCursor(results)
+        return command
+
+    def test_skips_existing_partition(self):
+        command = self.make_command([(True, True)])
+        command.create_partition("core_signalmessage", datetime(2026, 11, 1, tzinfo=dt_timezone.utc))
+
+        self.assertEqual(len(command.cursor.statements), 1)
+
+    def test_moves_rows_of_default_partition(self):
+        command = self.make_command([(False, True)])
+        command.create_partition("core_signalmessage", datetime(2026, 11, 1, tzinfo=dt_timezone.utc))
+
+        self.assertEqual(command.cursor.statements[1:], [
+            'LOCK TABLE "core_signalmessage_default" IN SHARE ROW EXCLUSIVE MODE',
+            'CREATE TABLE "core_signalmessage_p202611" (LIKE "core_signalmessage" INCLUDING DEFAULTS)',
+            'WITH moved AS (DELETE FROM "core_signalmessage_default" WHERE received_at >= %s AND received_at < %s'
+            ' RETURNING *) INSERT INTO "core_signalmessage_p202611" SELECT * FROM moved',
+            'ALTER TABLE "core_signalmessage" ATTACH PARTITION "core_signalmessage_p202611"'
+            " FOR VALUES FROM ('2026-11-01T00:00:00+00:00') TO ('2026-12-01T00:00:00+00:00')",
+        ])
+
+    def test_creates_partition_without_default(self):
+        command = self.make_command([(False, False)])
+        command.create_partition("core_signalmessage", datetime(2026, 12, 1, tzinfo=dt_timezone.utc))
+
+        self.assertEqual(
+            command.cursor.statements[1],
+            'CREATE TABLE "core_signalmessage_p202612" PARTITION OF "core_signalmessage"'
+            " FOR VALUES FROM ('2026-12-01T00:00:00+00:00') TO ('2027-01-01T00:00:00+00:00')",
+        )
+
+    def test_convert(self):
+        command = self.make_command([
+            [
+                ("core_signalmessage_event_key_uniq", "u", "UNIQUE (event_key, received_at)"),
+                ("core_signalmessage_pkey", "p", "PRIMARY KEY (id)"),
+            ],
+            [("CREATE INDEX core_signalmessage_idx ON public.core_signalmessage USING btree (received_at)",)],
+            (
+                datetime(2026, 1, 15, tzinfo=dt_timezone.utc),
+                datetime(2026, 2, 3, tzinfo=dt_timezone.utc),
+                41,
+            ),
+            (False, True),
+            (False, True),
+        ])
+        command.convert()
+        statements = command.cursor.statements
+
+        self.assertIn(
+            'CREATE TABLE "core_signalmessage_default" PARTITION OF "core_signalmessage_partitioned" DEFAULT',
+            statements,
+        )
+        self.assertEqual(
+            [statement for statement in statements if "ATTACH PARTITION" in statement],
+            [
+                'ALTER TABLE "core_signalmessage_partitioned" ATTACH PARTITION "core_signalmessage_p202601"'
+                " FOR VALUES FROM ('2026-01-01T00:00:00+00:00') TO ('2026-02-01T00:00:00+00:00')",
+                'ALTER TABLE "core_signalmessage_partitioned" ATTACH PARTITION "core_signalmessage_p202602"'
+                " FOR VALUES FROM ('2026-02-01T00:00:00+00:00') TO ('2026-03-01T00:00:00+00:00')",
+            ],
+        )
+        # The rows are copied once the partitions exist, then the constraints and indexes are replayed
+        self.assertEqual(statements[-9:], [
+            'INSERT INTO "core_signalmessage_partitioned" SELECT * FROM "core_signalmessage"',
+            'DROP TABLE "core_signalmessage"',
+            'ALTER TABLE "core_signalmessage_partitioned" RENAME TO "core_signalmessage"',
+            'CREATE SEQUENCE "core_signalmessage_partitioned_id_seq" OWNED BY "core_signalmessage".id',
+            "SELECT setval(%s, %s, false)",
+            'ALTER TABLE "core_signalmessage" ALTER COLUMN id'
+            """ SET DEFAULT nextval('"core_signalmessage_partitioned_id_seq"')""",
+            'ALTER TABLE "core_signalmessage" ADD CONSTRAINT "core_signalmessage_event_key_uniq"'
+            " UNIQUE (event_key, received_at)",
+            'ALTER TABLE "core_signalmessage" ADD CONSTRAINT "core_signalmessage_pkey" PRIMARY KEY (id, received_at)',
+            "CREATE INDEX core_signalmessage_idx ON public.core_signalmessage USING btree (received_at)",
+        ])
+
+    def test_detach_old_partitions(self):
+        command = self.make_command([
+            [("core_signalmessage_default",), ("core_signalmessage_p202608",), ("core_signalmessage_p202607",)],
+        ])
+        command.detach(datetime(2026, 8, 1, tzinfo=dt_timezone.utc), drop=True)
+
+        self.assertEqual(command.cursor.statements[1:], [
+            'ALTER TABLE "core_signalmessage" DETACH PARTITION "core_signalmessage_p202607"',
+            'DROP TABLE "core_signalmessage_p202607"',
+        ])
+
+
+class UTF16TestCase(SimpleTestCase):
+    def test_utf16_len_matches_reference(self):
+        rng = random.Random(9)
+        for name, alphabet in ALPHABETS.items():
+            for _ in range(500):
+                text = random_text(rng, alphabet)
+                with self.subTest(alphabet=name, text=text):
+                    self.assertEqual(utf16_len(text), reference_utf16_len(text))
+
+    def test_utf16_offsets_matches_reference(self):
+        rng = random.Random(9)
+        for name, alphabet in ALPHABETS.items():
+            for _ in range(500):
+                text = random_text(rng, alphabet)
+                offsets = [rng.randint(0, len(text)) for _ in range(rng.randint(0, 8))]
+                with self.subTest(alphabet=name, text=text, offsets=offsets):
+                    self.assertEqual(
+                        utf16_offsets(text, offsets),
+                        [reference_utf16_len(text[:offset]) for offset in offsets],
+                    )
+
+    def test_utf16_offsets_keeps_order_and_duplicates(self):
+        text = "a😀b😀c"
+        self.assertEqual(utf16_offsets(text, [5, 0, 2, 2, 5, 1]), [7, 0, 3, 3, 7, 1])
+        self.assertEqual(utf16_offsets(text, iter([3, 3])), [4, 4])
+        self.assertEqual(utf16_offsets(text, []), [])
+        self.assertEqual(utf16_offsets("abc", [3, 1, 1]), [3, 1, 1])
+
+
+class MessageStyleTestCase(SimpleTestCase):
+    def test_matches_reference_on_flat_styles(self):
+        rng = random.Random(8)
+        for _ in range(300):
+            message = random_styled_message(rng, rng.randint(0, 200))
+            with self.subTest(message=message):
+                text, styles = parse_message_style(message)
+                self.assertEqual((text, list(styles)), reference_parse_message_style(message))
+
+    def test_nested_styles(self):
+        self.assertEqual(
+            parse_message_style("#bold *and italic*#"),
+            ("bold and italic", ("0:15:BOLD", "5:10:ITALIC")),
+        )
+        self.assertEqual(
+            parse_message_style("_a ~b |c| d~ e_"),
+            ("a b c d e", ("0:9:MONOSPACE", "2:5:STRIKETHROUGH", "4:1:SPOILER")),
+        )
+
+    def test_crossing_markers_are_plain_text(self):
+        # The first closed style wins, like the previous implementation
+        self.assertEqual(parse_message_style("*a #b* c#"), ("a #b c#", ("0:4:ITALIC",)))
+        self.assertEqual(parse_message_style("#a *b# c*"), ("a *b c*", ("0:4:BOLD",)))
+
+    def test_escaped_markers(self):
+        self.assertEqual(parse_message_style("\\*not\\* *it*"), ("*not* it", ("6:2:ITALIC",)))
+        self.assertEqual(parse_message_style("a\\\\*b*"), ("a\\b", ("2:1:ITALIC",)))
+        self.assertEqual(parse_message_style("\\#"), ("#", ()))
+
+    def test_unclosed_and_empty_markers(self):
+        self.assertEqual(parse_message_style("*open"), ("*open", ()))
+        self.assertEqual(parse_message_style("a # b"), ("a # b", ()))
+        self.assertEqual(parse_message_style("**a**"), ("*a*", ("1:1:ITALIC",)))
+        self.assertEqual(parse_message_style("~~"), ("~~", ()))
+
+    def test_offsets_in_utf16_code_units(self):
+        self.assertEqual(parse_message_style("😀 *x*"), ("😀 x", ("3:1:ITALIC",)))
+        # Ranges of parse_style_ranges stay in code points
+        self.assertEqual(parse_style_ranges("😀 *x*"), ("😀 x", [(2, 3, "ITALIC")]))
+
+
+class MessageTemplateTestCase(SimpleTestCase):
+    def assertRendersLikeFormat(self, template: str, **values):
+        self.assertEqual(MessageTemplate(template).render(**values), parse_message_style(template.format(**values)))
+
+    def test_matches_format_then_parse(self):
+        rng = random.Random(10)
+        tokens = ["alert", " ", "😀", "é", *STYLE_CHAR, "{{", "}}", "{a}", "{b:>6}", "{c!r}", "{d:.2f}", "{a:{width}}"]
+        alphabet = ["x", "é", " ", "😀", chr(0x1F3FD)]
+        for _ in range(500):
+            template = "".join(rng.choice(tokens) for _ in range(rng.randint(0, 20)))
+            values = {
+                "a": random_text(rng, alphabet, max_length=4, min_length=1),
+                "b": random_text(rng, alphabet, max_length=8, min_length=1),
+                "c": random_text(rng, alphabet, max_length=4, min_length=1),
+                "d": rng.uniform(-100, 100),
+                "width": rng.choice(["<3", "^7", ""]),
+            }
+            with self.subTest(template=template, values=values):
+                self.assertRendersLikeFormat(template, **values)
+
+    def test_astral_and_empty_values(self):
+        self.assertRendersLikeFormat("#Alert# for _{city}_: {temperature:.1f}°C", city="Zoé 😀", temperature=31.44)
+        self.assertRendersLikeFormat("*a{x}b* ~{y}~ {x}|c|", x="", y="😀😀")
+        self.assertRendersLikeFormat("😀*{x}#y{z}#*", x="👍🏽", z="")
+        self.assertEqual(
+            MessageTemplate("*a{x}b*").render(x="😀"),
+            ("a😀b", ("0:4:ITALIC",)),
+        )
+
+    def test_escaped_braces_and_format_specs(self):
+        self.assertRendersLikeFormat("{{*a*}} {v:{width}} |{v!r}|", v="é😀", width=">6")
+        self.assertEqual(MessageTemplate("{{*{v:03d}*}}").render(v=7), ("{007}", ("1:3:ITALIC",)))
+
+    def test_empty_styled_field_is_dropped(self):
+        # Formatting first would leave the markers of the empty span as plain text
+        self.assertEqual(MessageTemplate("*{x}* b").render(x=""), (" b", ()))
+
+    def test_field_values_are_plain_text(self):
+        self.assertEqual(MessageTemplate("*{x}*").render(x="#b# \\*"), ("#b# \\*", ("0:6:ITALIC",)))
+
+    def test_positional_fields_are_rejected(self):
+        with self.assertRaises(ValueError):
+            MessageTemplate("{} {0}")
+
+
+@tag("benchmark")
+class MessageStyleBenchmarkTestCase(SimpleTestCase):
+    def test_compared_with_reference_on_10kb_messages(self):
+        rng = random.Random(8)
+        messages = [random_styled_message(rng, 10_000) for _ in range(10)]
+
+        def reference():
+            for message in messages:
+                reference_parse_message_style(message)
+
+        def uncached():
+            for message in messages:
+                parse_message_style.__wrapped__(message)
+
+        def cached():
+            for message in messages:
+                parse_message_style(message)
+
+        reference_seconds = min(timeit.repeat(reference, number=3, repeat=3))
+        uncached_seconds = min(timeit.repeat(uncached, number=3, repeat=3))
+        cached_seconds = min(timeit.repeat(cached, number=3, repeat=3))
+        print(
+            f"\nparse_message_style on 10 KB: {reference_seconds * 1000 / 30:.3f}ms"
+            f" -> {uncached_seconds * 1000 / 30:.3f}ms uncached, {cached_seconds * 1000 / 30:.4f}ms cached per message"
+        )
+        # The previous parser is already linear on flat styles, the gain is on re-sent messages
+        self.assertLess(cached_seconds, reference_seconds / 100)
+
+
+@tag("benchmark")
+class UTF16BenchmarkTestCase(SimpleTestCase):
+    def test_utf16_len_is_faster_than_reference(self):
+        rng = random.Random(9)
+        for name, alphabet in ALPHABETS.items():
+            text = random_text(rng, alphabet, max_length=10_000, min_length=10_000)
+            reference = min(timeit.repeat(lambda: reference_utf16_len(text), number=20, repeat=3))
+            current = min(timeit.repeat(lambda: utf16_len(text), number=20, repeat=3))
+            print(f"\nutf16_len on 10k {name}: {reference * 50:.3f}ms -> {current * 50:.3f}ms per call")
+            self.assertLess(current, reference)
+
+    def test_utf16_offsets_is_faster_than_reference(self):
+        rng = random.Random(9)
+        text = random_text(rng, ALPHABETS["astral"], max_length=10_000, min_length=10_000)
+        offsets = [rng.randint(0, len(text)) for _ in range(200)]
+
+        def reference_offsets():
+            return [reference_utf16_len(text[:offset]) for offset in offsets]
+
+        reference = min(timeit.repeat(reference_offsets, number=3, repeat=3))
+        current = min(timeit.repeat(lambda: utf16_offsets(text, offsets), number=3, repeat=3))
+        print(f"\nutf16_offsets of 200 offsets on 10k astral: {reference * 333:.3f}ms -> {current * 333:.3f}ms per call")
+        self.assertLess(current, reference)
+
+
+@tag("benchmark")
+class SignalMessagePageBenchmarkTestCase(TestCase):
+    message_count = 20_000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob, cls.carol = SignalUser.objects.bulk_create([
+            SignalUser(source_number=number, source_name=name, display_name=name)
+            for number, name in (("+33600000011", "Alice"), ("+33600000012", "Bob"), ("+33600000013", "Carol"))
+        ])
+        started_at = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        pairs = [(cls.alice, cls.bob), (cls.bob, cls.alice), (cls.carol, cls.bob), (cls.bob, cls.carol)]
+        SignalMessage.objects.bulk_create(
+            [
+                SignalMessage(
+                    source_user=pairs[index % 4][0],
+                    target_user=pairs[index % 4][1],
+                    text_content=f"message {index}",
+                    is_incoming=True,
+                    received_at=started_at + timedelta(seconds=index),
+                )
+                for index in range(cls.message_count)
+            ],
+            batch_size=2000,
+        )
+
+    def test_page_cost_does_not_grow_with_offset(self):
+        queryset = SignalMessage.objects.with_user(self.alice)
+        ordered = queryset.order_by("-received_at", "-id")
+        limit = 50
+
+        timings = []
+        for offset in (0, 2_000, 5_000, 9_000):
+            cursor = None
+            if offset > 0:
+                cursor = encode_cursor(ordered[offset - 1])
+
+            def by_offset():
+                return list(ordered[offset:offset + limit])
+
+            def by_cursor():
+                return queryset.page(limit, cursor)[0]
+
+            self.assertEqual(by_cursor(), by_offset())
+            offset_seconds = min(timeit.repeat(by_offset, number=5, repeat=3)) / 5
+            cursor_seconds = min(timeit.repeat(by_cursor, number=5, repeat=3)) / 5
+            timings.append((offset, offset_seconds, cursor_seconds))
+            print(
+                f"\npage of {limit} at offset {offset} of {self.message_count // 2} messages with a user:"
+                f" {offset_seconds * 1000:.2f}ms with OFFSET -> {cursor_seconds * 1000:.2f}ms with page()"
+            )
+
+        _first_offset, _first_offset_seconds, first_cursor_seconds = timings[0]
+        _last_offset, last_offset_seconds, last_cursor_seconds = timings[-1]
+        self.assertLess(last_cursor_seconds, last_offset_seconds)
+        # The deepest page costs about the same as the first one
+        self.assertLess(last_cursor_seconds, first_cursor_seconds * 3)
@@ -1,17 +1,42 @@
 import json
 import logging
 
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from core import metrics
+from core.ingestion import event_buffer
+from core.signal_client.envelopes import is_valid_event
 
 logger = logging.getLogger(name=__name__)
 
 
 @csrf_exempt
+@require_POST
 def base_view(request: HttpRequest):
-    logger.warning(
-        json.loads(
-            request.body.decode()
-        )
+    try:
+        payload = json.loads(request.body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return HttpResponseBadRequest()
+
+    events = payload if isinstance(payload, list) else [payload]
+    valid_events = [event for event in events if is_valid_event(event)]
+    if len(valid_events) < len(events):
+        logger.debug("Ignoring %d events without envelope", len(events) - len(valid_events))
+
+    if not event_buffer.push(valid_events):
+        # The buffer is full, the relay is expected to retry later
+        return HttpResponse(status=503)
+
+    return HttpResponse(status=202)
+
+
+@require_GET
+def ingestion_stats_view(request: HttpRequest):
+    return JsonResponse(
+        {
+            "buffer_depth": event_buffer.depth,
+            **metrics.snapshot(),
+        }
     )
-    return HttpResponse(status=200)
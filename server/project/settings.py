@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+from decimal import Decimal
 from pathlib import Path
 import os
 
@@ -137,8 +138,47 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 SIGNAL_URL = os.getenv("SIGNAL_URL", "")
 REQUESTS_TIMEOUT_SECONDS = 30.0
+SIGNAL_POOL_SIZE = int(os.getenv("SIGNAL_POOL_SIZE", "10"))
+SIGNAL_MAX_RETRIES = int(os.getenv("SIGNAL_MAX_RETRIES", "3"))
+SIGNAL_RETRY_BACKOFF_SECONDS = float(os.getenv("SIGNAL_RETRY_BACKOFF_SECONDS", "0.5"))
+# Keep it lower than or equal to SIGNAL_POOL_SIZE so concurrent sends reuse pooled connections
+SIGNAL_FAN_OUT_CONCURRENCY = int(os.getenv("SIGNAL_FAN_OUT_CONCURRENCY", "8"))
+SIGNAL_BATCH_SIZE = int(os.getenv("SIGNAL_BATCH_SIZE", "100"))
+SIGNAL_RECEIVE_CHUNK_SIZE = int(os.getenv("SIGNAL_RECEIVE_CHUNK_SIZE", "500"))
+SIGNAL_ACCOUNTS_CACHE_TTL_SECONDS = float(os.getenv("SIGNAL_ACCOUNTS_CACHE_TTL_SECONDS", "300"))
+SIGNAL_ACCOUNT_RATE_PER_SECOND = float(os.getenv("SIGNAL_ACCOUNT_RATE_PER_SECOND", "5"))
+SIGNAL_ACCOUNT_RATE_BURST = float(os.getenv("SIGNAL_ACCOUNT_RATE_BURST", "20"))
+SIGNAL_RECIPIENT_RATE_PER_SECOND = float(os.getenv("SIGNAL_RECIPIENT_RATE_PER_SECOND", "1"))
+SIGNAL_RECIPIENT_RATE_BURST = float(os.getenv("SIGNAL_RECIPIENT_RATE_BURST", "5"))
+# Longer rate limiter delays requeue the message instead of blocking the dispatcher
+SIGNAL_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("SIGNAL_RATE_LIMIT_MAX_WAIT_SECONDS", "2"))
 MAIN_BOT_ACCOUNT_SOURCE_NUMBER = os.getenv("MAIN_BOT_ACCOUNT_SOURCE_NUMBER")
 
+# Incoming events are stored every INGESTION_FLUSH_EVENTS events or INGESTION_FLUSH_INTERVAL_MS
+INGESTION_FLUSH_EVENTS = int(os.getenv("INGESTION_FLUSH_EVENTS", "500"))
+INGESTION_FLUSH_INTERVAL_MS = int(os.getenv("INGESTION_FLUSH_INTERVAL_MS", "200"))
+INGESTION_BUFFER_MAX_EVENTS = int(os.getenv("INGESTION_BUFFER_MAX_EVENTS", "50000"))
+INGESTION_DEDUP_CACHE_SIZE = int(os.getenv("INGESTION_DEDUP_CACHE_SIZE", "100000"))
+# Batches failing on an unavailable database are retried with a backoff doubling up to this delay
+INGESTION_RETRY_MAX_SECONDS = float(os.getenv("INGESTION_RETRY_MAX_SECONDS", "30"))
+
+# Rows older than `days` are removed by the apply_retention command, `None` keeps them forever
+DATA_RETENTION = {
+    "core.SignalMessage": {
+        "field": "received_at",
+        "days": int(os.getenv("SIGNAL_MESSAGE_RETENTION_DAYS")) if os.getenv("SIGNAL_MESSAGE_RETENTION_DAYS") else None,
+    },
+    "weather_bot.Forecast": {
+        "field": "segment_datetime",
+        "days": int(os.getenv("FORECAST_RETENTION_DAYS", "2")),
+    },
+}
+
 # WEATHER BOT SETTING
 INFO_CLIMAT_API_KEY = os.getenv("INFO_CLIMAT_API_KEY", "")
 INFO_CLIMAT_API_KEYRING_ID = os.getenv("INFO_CLIMAT_API_KEYRING_ID", "")
+# Resolution in degrees of the GFS grid served by infoclimat
+INFO_CLIMAT_GRID_RESOLUTION = Decimal(os.getenv("INFO_CLIMAT_GRID_RESOLUTION", "0.25"))
+# GFS runs at 00, 06, 12 and 18 UTC, infoclimat serves them this much later
+INFO_CLIMAT_RUN_AVAILABILITY_DELAY_MINUTES = int(os.getenv("INFO_CLIMAT_RUN_AVAILABILITY_DELAY_MINUTES", "300"))
+FORECAST_CACHE_MAX_LOCATIONS = int(os.getenv("FORECAST_CACHE_MAX_LOCATIONS", "1024"))
@@ -16,9 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from core.views import base_view
+from core.views import base_view, ingestion_stats_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("poke/", base_view)
+    path("poke/", base_view),
+    path("poke/stats/", ingestion_stats_view),
 ]
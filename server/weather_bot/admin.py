@@ -1,19 +1,39 @@
 from django.contrib import admin
+from core.paginator import EstimatedCountPaginator
 from weather_bot.models.forecast import Forecast
 from weather_bot.models.alert_condition import WeatherAlertCondition, WeatherAlertConfiguration
 # Register your models here.
 
 
 class ForecastAdmin(admin.ModelAdmin):
-    pass
+    list_display = (
+        "segment_datetime",
+        "latitude",
+        "longitude",
+        "average_temperature_celsius",
+        "average_wind_speed",
+        "wind_gust_speed",
+        "could_snow",
+        "cloud_coverage",
+    )
+    # Range filters on the segment_datetime index, a date_hierarchy would list the distinct dates of every row
+    list_filter = (("segment_datetime", admin.DateFieldListFilter), "could_snow")
+    ordering = ("-segment_datetime",)
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # The raw forecast is loaded on access, i.e. only on the change page
+        return super().get_queryset(request).defer("data")
 
 
 class WeatherAlertConfigurationAdmin(admin.ModelAdmin):
-    pass
+    list_display = ("id", "latitude", "longitude")
 
 
 class WeatherAlertConditionAdmin(admin.ModelAdmin):
-    pass
+    list_display = ("id", "right_operand", "operator", "left_operand")
 
 
 admin.site.register(Forecast, ForecastAdmin)
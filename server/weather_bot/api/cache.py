@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from core import metrics
+from weather_bot.api.shared import SingleFlight, snap_to_grid
+from weather_bot.api.weather import WeatherAPI
+from weather_bot.models.forecast import Forecast
+
+MODEL_RUN_INTERVAL = timedelta(hours=6)
+
+Cell = Tuple[Decimal, Decimal]
+
+
+def next_model_update(fetched_at: datetime) -> datetime:
+    """
+    Return when the GFS run following the one available at `fetched_at` becomes available.
+    """
+    delay = timedelta(minutes=settings.INFO_CLIMAT_RUN_AVAILABILITY_DELAY_MINUTES)
+    # Runs start at 00, 06, 12 and 18 UTC
+    available_at = (fetched_at - delay).astimezone(dt_timezone.utc)
+    latest_run = available_at.replace(
+        hour=available_at.hour - available_at.hour % 6,
+        minute=0,
+        second=0,
+        microsecond=0,
+    )
+    return latest_run + MODEL_RUN_INTERVAL + delay
+
+
+class ForecastCache:
+    """
+    Read-through cache of the upcoming forecasts of a location.
+
+    Forecasts are served from memory, then from the Forecast table, as long as
+    no model run was published since they were fetched. Otherwise they are fetched
+    from infoclimat and saved, a single request being made per grid cell at a time.
+    """
+
+    def __init__(self, max_locations: int, weather_api: Optional[WeatherAPI] = None):
+        self.max_locations = max_locations
+        self._weather_api = weather_api
+        # cell -> (fetched at, forecasts), least recently used first
+        self._entries: "OrderedDict[Cell, Tuple[datetime, List[Forecast]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshes = SingleFlight()
+
+    @property
+    def weather_api(self) -> WeatherAPI:
+        if self._weather_api is None:
+            self._weather_api = WeatherAPI()
+        return self._weather_api
+
+    def get_forecasts(self, latitude: Decimal, longitude: Decimal) -> List[Forecast]:
+        cell = snap_to_grid(latitude, longitude)
+        now = timezone.now()
+
+        entry = self._get(cell)
+        if entry is not None and now < next_model_update(entry[0]):
+            metrics.increment("forecast_cache.memory_hit")
+            return [forecast for forecast in entry[1] if forecast.segment_datetime >= now]
+
+        forecasts = list(
+            Forecast.objects.filter(
+                latitude=cell[0],
+                longitude=cell[1],
+                segment_datetime__gte=now,
+            ).order_by(
+                "segment_datetime"
+            )
+        )
+        if len(forecasts) > 0:
+            # The oldest row tells which run the whole set is at least as recent as
+            fetched_at = min(forecast.modified_at for forecast in forecasts)
+            if now < next_model_update(fetched_at):
+                metrics.increment("forecast_cache.db_hit")
+                self._put(cell, fetched_at, forecasts)
+                return forecasts
+
+        metrics.increment("forecast_cache.miss")
+        return self._refreshes.do(cell, self._refresh, cell)
+
+    def invalidate(self, latitude: Decimal, longitude: Decimal):
+        with self._lock:
+            self._entries.pop(snap_to_grid(latitude, longitude), None)
+
+    def _refresh(self, cell: Cell) -> List[Forecast]:
+        fetched_at = timezone.now()
+        forecasts = self.weather_api.get_forecasts(*cell)
+        self._put(cell, fetched_at, forecasts)
+        return forecasts
+
+    def _get(self, cell: Cell) -> Optional[Tuple[datetime, List[Forecast]]]:
+        with self._lock:
+            entry = self._entries.get(cell)
+            if entry is not None:
+                self._entries.move_to_end(cell)
+            return entry
+
+    def _put(self, cell: Cell, fetched_at: datetime, forecasts: List[Forecast]):
+        with self._lock:
+            self._entries[cell] = (fetched_at, forecasts)
+            self._entries.move_to_end(cell)
+            while len(self._entries) > self.max_locations:
+                self._entries.popitem(last=False)
+
+
+forecast_cache = ForecastCache(max_locations=settings.FORECAST_CACHE_MAX_LOCATIONS)
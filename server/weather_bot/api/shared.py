@@ -1,48 +1,134 @@
 
+import threading
+from concurrent.futures import Future
 from datetime import datetime, timedelta, tzinfo
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from django.conf import settings
+
+HOUR = timedelta(hours=1)
+ZERO = timedelta(0)
+
+
+def _last_sunday_in_month(year: int, month: int) -> datetime:
+    """Return the last Sunday of the given month."""
+    last_day = datetime(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last_day - timedelta(days=(last_day.weekday() + 1) % 7)
 
 
 class ParisTimezone(tzinfo):
-    def __init__(self):
-        self.std_offset = timedelta(hours=1)  # CET (UTC+1)
-        self.dst_offset = timedelta(hours=2)  # CEST (UTC+2)
-        self.dst_start = self._last_sunday_in_march
-        self.dst_end = self._last_sunday_in_october
+    """
+    Europe/Paris: CET (UTC+1), and CEST (UTC+2) from the last Sunday of March to the last
+    Sunday of October, both changes happening at 01:00 UTC.
+
+    Transitions are computed once per year, so offset lookups are dictionary hits.
+    """
 
-    def _last_sunday_in_month(self, year, month):
-        """Return the last Sunday of the given month."""
-        last_day = datetime(year, month + 1, 1) - \
-            timedelta(days=1) if month != 12 else datetime(year + 1, 1, 1) - timedelta(days=1)
-        return last_day - timedelta(days=last_day.weekday() + 1)  # last Sunday of the month
+    std_offset = timedelta(hours=1)  # CET (UTC+1)
+    dst_offset = timedelta(hours=2)  # CEST (UTC+2)
 
-    @property
-    def _last_sunday_in_march(self):
-        return self._last_sunday_in_month(datetime.now().year, 3)
+    # year -> (DST start, DST end), as naive UTC datetimes
+    _transitions: Dict[int, Tuple[datetime, datetime]] = dict()
 
-    @property
-    def _last_sunday_in_october(self):
-        return self._last_sunday_in_month(datetime.now().year, 10)
+    def _utc_transitions(self, year: int) -> Tuple[datetime, datetime]:
+        transitions = self._transitions.get(year)
+        if transitions is None:
+            transitions = self._transitions[year] = (
+                _last_sunday_in_month(year, 3).replace(hour=1),
+                _last_sunday_in_month(year, 10).replace(hour=1),
+            )
+        return transitions
 
     def utcoffset(self, dt):
-        if self.dst(dt):
-            return self.dst_offset
-        return self.std_offset
+        return self.std_offset + self.dst(dt)
 
     def dst(self, dt):
         if dt is None:
-            return False
+            return ZERO
 
-        # Daylight saving time starts last Sunday in March
-        dst_start = self._last_sunday_in_march.replace(hour=2)
-        # Daylight saving time ends last Sunday in October
-        dst_end = self._last_sunday_in_october.replace(hour=3)
+        dst_start, dst_end = self._utc_transitions(dt.year)
+        # In local time, DST starts at 02:00 CET and ends at 03:00 CEST
+        wall_time = dt.replace(tzinfo=None, fold=0)
+        dst_start_wall_time = dst_start + self.std_offset
+        dst_end_wall_time = dst_end + self.dst_offset
 
-        if dst_start <= dt.replace(tzinfo=None) < dst_end:
-            return True
-        else:
-            return False
+        if not dst_start_wall_time <= wall_time < dst_end_wall_time:
+            return ZERO
+        if wall_time < dst_start_wall_time + HOUR:
+            # Skipped hour, `fold` tells on which side of the change it is taken (PEP 495)
+            return HOUR if dt.fold == 1 else ZERO
+        if wall_time >= dst_end_wall_time - HOUR:
+            # Repeated hour, the first occurrence is the DST one
+            return HOUR if dt.fold == 0 else ZERO
+        return HOUR
+
+    def fromutc(self, dt):
+        utc_time = dt.replace(tzinfo=None)
+        dst_start, dst_end = self._utc_transitions(utc_time.year)
+
+        if dst_start <= utc_time < dst_end:
+            return (utc_time + self.dst_offset).replace(tzinfo=self)
+
+        # The hour after the end of DST is the second occurrence of the repeated hour
+        fold = 1 if dst_end <= utc_time < dst_end + HOUR else 0
+        return (utc_time + self.std_offset).replace(tzinfo=self, fold=fold)
 
     def tzname(self, dt):
         if self.dst(dt):
             return "CEST"
         return "CET"
+
+    def __repr__(self):
+        return "ParisTimezone()"
+
+
+PARIS_TIMEZONE = ParisTimezone()
+
+
+COORDINATE_QUANTUM = Decimal("0.0000001")  # decimal_places of the latitude and longitude fields
+
+
+def snap_to_grid(latitude: Decimal, longitude: Decimal) -> Tuple[Decimal, Decimal]:
+    """
+    Return the weather model grid point closest to a location, every location of a cell sharing its forecasts.
+    """
+    resolution: Decimal = settings.INFO_CLIMAT_GRID_RESOLUTION
+
+    def snap(value: Decimal) -> Decimal:
+        cells = (Decimal(str(value)) / resolution).to_integral_value(rounding=ROUND_HALF_UP)
+        return (cells * resolution).quantize(COORDINATE_QUANTUM)
+
+    return snap(latitude), snap(longitude)
+
+
+class SingleFlight:
+    """
+    Run a single call at a time per key, concurrent callers with the same key wait for its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = dict()
+
+    def do(self, key: Hashable, function: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = Future()
+
+        if not is_leader:
+            return call.result()
+
+        try:
+            result = function(*args)
+        except BaseException as error:
+            call.set_exception(error)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
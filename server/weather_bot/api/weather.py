@@ -1,27 +1,45 @@
 from datetime import datetime
 from decimal import Decimal
-from statistics import mean
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 import requests
 from django.conf import settings
 from django.utils import timezone
-from weather_bot.api.shared import ParisTimezone
+from weather_bot.api.shared import PARIS_TIMEZONE, SingleFlight, snap_to_grid
 from weather_bot.models.forecast import Forecast
 
 # INFO_CLIMAT_API_URL = 'http://www.infoclimat.fr/public-api/gfs/json'
 INFO_CLIMAT_API_URL = 'http://www.infoclimat.fr/public-api/gfs/json'
 
+# Shared by every WeatherAPI of the process
+forecast_fetches = SingleFlight()
+
 
 class WeatherAPI:
+    def __init__(self, session: Optional[requests.Session] = None):
+        # A session shared between threads reuses its pooled connections
+        self.session: requests.Session = session if session is not None else requests.Session()
+
     def get_forecasts(self, latitude: Decimal, longitude: Decimal) -> List[Forecast]:
+        return save_forecasts(self.fetch_forecasts(latitude, longitude))
+
+    def fetch_forecasts(self, latitude: Decimal, longitude: Decimal) -> List[Forecast]:
+        """
+        Fetch the upcoming forecasts of the grid cell of a location, without saving them.
+
+        Concurrent fetches of the same cell are coalesced into a single request.
+        """
+        cell = snap_to_grid(latitude, longitude)
+        return forecast_fetches.do(cell, self._fetch_cell_forecasts, *cell)
+
+    def _fetch_cell_forecasts(self, latitude: Decimal, longitude: Decimal) -> List[Forecast]:
         url = (
             INFO_CLIMAT_API_URL
             + f"?_ll={latitude!s},{longitude!s}"
             + f"&_auth={settings.INFO_CLIMAT_API_KEY}"
             + f"&_c={settings.INFO_CLIMAT_API_KEYRING_ID}"
         )
-        forecasts_request = requests.get(
+        forecasts_request = self.session.get(
             url=url,
             timeout=15,
             allow_redirects=True,
@@ -29,61 +47,72 @@ class WeatherAPI:
 
         forecasts_request.raise_for_status()
 
-        if forecasts_request.status_code != 200 or forecasts_request.json()["request_state"] != 200:
+        # Decoded once and reused for the status check and the parsing
+        payload = forecasts_request.json()
+        if forecasts_request.status_code != 200 or payload["request_state"] != 200:
             raise RuntimeError("oupsi")  # FIXME raise an error
 
-        forecasts_to_create_or_update: list[Forecast] = [
+        return parse_forecasts(payload, latitude, longitude)
+
+
+def save_forecasts(forecasts: List[Forecast], batch_size: Optional[int] = None) -> List[Forecast]:
+    # auto_now is only applied to the inserted values, conflict updates have to list modified_at
+    return Forecast.objects.bulk_create(
+        forecasts,
+        batch_size=batch_size,
+        update_conflicts=True,
+        update_fields=[
+            "data",
+            "average_temperature_celsius",
+            "average_wind_speed",
+            "wind_gust_speed",
+            "could_snow",
+            "cloud_coverage",
+            "modified_at",
+        ],
+        unique_fields=[
+            "segment_datetime",
+            "latitude",
+            "longitude",
+        ],
+    )
+
+
+def parse_forecasts(payload: Dict[str, Any], latitude: Decimal, longitude: Decimal) -> List[Forecast]:
+    """
+    Build the upcoming forecasts of an infoclimat GFS payload, in a single pass over its segments.
+    """
+    now = timezone.now()
+    forecasts: List[Forecast] = []
+    for key, forecast_data in payload.items():
+        # Segments are keyed by their datetime, other keys are request metadata
+        if not key[:1].isdigit():
+            continue
+        segment_datetime = get_datetime_from_string(key)
+        if segment_datetime is None or segment_datetime < now:
+            continue
+
+        wind_speeds = [Decimal(value) for value in forecast_data["vent_moyen"].values()]
+        forecasts.append(
             Forecast(
-                segment_datetime=key_as_datetime,
+                segment_datetime=segment_datetime,
                 latitude=latitude,
                 longitude=longitude,
                 data=forecast_data,
                 average_temperature_celsius=Decimal(forecast_data["temperature"]["sol"]) + Decimal("-273.15"),
-                average_wind_speed=mean(
-                    Decimal(value)
-                    for _key, value in forecast_data["vent_moyen"].items()
-                ),
-                wind_gust_speed=max(
-                    Decimal(value)
-                    for _key, value in forecast_data["vent_rafales"].items()
-                ),
+                average_wind_speed=sum(wind_speeds, Decimal(0)) / len(wind_speeds),
+                wind_gust_speed=Decimal(max(forecast_data["vent_rafales"].values(), key=float)),
                 could_snow=True if forecast_data["risque_neige"] != "non" else False,
                 cloud_coverage=int(forecast_data["nebulosite"]["totale"])
             )
-            for key, forecast_data in forecasts_request.json().items()
-            if (
-                (
-                    key_as_datetime := get_datetime_from_string(key)
-                ) is not None
-                and key_as_datetime >= timezone.now()
-            )
-        ]
-
-        return Forecast.objects.bulk_create(
-            forecasts_to_create_or_update,
-            update_conflicts=True,
-            update_fields=[
-                "data",
-                "average_temperature_celsius",
-                "average_wind_speed",
-                "wind_gust_speed",
-                "could_snow",
-                "cloud_coverage",
-            ],
-            unique_fields=[
-                "segment_datetime",
-                "latitude",
-                "longitude",
-            ],
-
         )
 
+    return forecasts
+
 
 def get_datetime_from_string(date_string: str) -> Optional[datetime]:
     try:
-        date_string_with_tz = (
-            date_string + f"+0{int(ParisTimezone().utcoffset(timezone.now()).seconds / 3600)}:00"
-        )
-        return datetime.fromisoformat(date_string_with_tz)
+        # Segments are in Paris local time, the offset depends on each segment's own date
+        return datetime.fromisoformat(date_string).replace(tzinfo=PARIS_TIMEZONE)
     except ValueError:
         return None
@@ -0,0 +1,68 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db.transaction import atomic
+from requests.adapters import HTTPAdapter
+
+from weather_bot.api.shared import snap_to_grid
+from weather_bot.api.weather import WeatherAPI, save_forecasts
+from weather_bot.models.alert_condition import WeatherAlertConfiguration
+from weather_bot.models.forecast import Forecast
+
+logger = logging.getLogger(name=__name__)
+
+
+class Command(BaseCommand):
+    help = "Refresh the forecasts of every location with an alert configuration"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=16, help="Maximum number of concurrent requests")
+        parser.add_argument("--batch-size", type=int, default=2000, help="Number of forecasts per upsert query")
+
+    def handle(self, *args, **options):
+        # Configurations of a same grid cell share its forecasts
+        locations = sorted({
+            snap_to_grid(latitude, longitude)
+            for latitude, longitude in WeatherAlertConfiguration.objects.values_list(
+                "latitude",
+                "longitude",
+            ).distinct()
+        })
+        if len(locations) == 0:
+            self.stdout.write("No location to refresh")
+            return
+
+        forecasts: List[Forecast] = []
+        failures = 0
+        with requests.Session() as session:
+            adapter = HTTPAdapter(pool_maxsize=options["workers"])
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            weather_api = WeatherAPI(session=session)
+
+            # Requests only, the results are saved together once they are all fetched
+            with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+                futures = {
+                    executor.submit(weather_api.fetch_forecasts, latitude, longitude): (latitude, longitude)
+                    for latitude, longitude in locations
+                }
+                for future in as_completed(futures):
+                    try:
+                        forecasts.extend(future.result())
+                    except Exception:
+                        # A failed location, request or malformed payload, must not lose the others
+                        failures += 1
+                        logger.exception("Failed to fetch forecasts for %s", futures[future])
+
+        with atomic():
+            save_forecasts(forecasts, batch_size=options["batch_size"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Refreshed {len(forecasts)} forecasts of {len(locations) - failures} locations"
+                f" ({failures} failed)"
+            )
+        )
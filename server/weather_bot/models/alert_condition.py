@@ -1,5 +1,10 @@
+from decimal import Decimal
+from typing import Tuple
+
 from django.db import models
 
+from weather_bot.api.shared import snap_to_grid
+
 
 class WeatherAlertConfiguration(models.Model):
     class Meta:
@@ -10,6 +15,13 @@ class WeatherAlertConfiguration(models.Model):
     latitude = models.DecimalField("latitude", max_digits=9, decimal_places=7)
     longitude = models.DecimalField("longitude", max_digits=10, decimal_places=7)
 
+    @property
+    def grid_cell(self) -> Tuple[Decimal, Decimal]:
+        """
+        Coordinates under which the forecasts of this location are stored.
+        """
+        return snap_to_grid(self.latitude, self.longitude)
+
 
 class WeatherAlertCondition(models.Model):
     class WeatherConditionOperator(models.TextChoices):
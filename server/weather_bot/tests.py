@@ -1,3 +1,382 @@
-from django.test import TestCase
+import json
+import threading
+import timeit
+from datetime import datetime, timedelta, timezone as dt_timezone, tzinfo
+from decimal import Decimal
+from statistics import mean
+from unittest import mock
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings, tag
+from django.utils import timezone
+
+from core import metrics
+from weather_bot.api.cache import ForecastCache, next_model_update
+from weather_bot.api.shared import PARIS_TIMEZONE, SingleFlight, _last_sunday_in_month, snap_to_grid
+from weather_bot.api.weather import WeatherAPI, parse_forecasts, save_forecasts
+from weather_bot.models.forecast import Forecast
+
+
+def make_forecast(segment_datetime: datetime, cloud_coverage: int = 0) -> Forecast:
+    return Forecast(
+        segment_datetime=segment_datetime,
+        latitude=Decimal("48.7500000"),
+        longitude=Decimal("2.2500000"),
+        data={},
+        average_temperature_celsius=Decimal("12.5"),
+        average_wind_speed=Decimal("3"),
+        wind_gust_speed=Decimal("8"),
+        could_snow=False,
+        cloud_coverage=cloud_coverage,
+    )
+
+
+def make_gfs_payload(first_segment: datetime, segments: int = 64) -> dict:
+    """
+    A payload in the format of infoclimat's GFS API, one segment every 3 hours in Paris local time.
+    """
+    payload = {
+        "request_state": 200,
+        "request_key": "fd543c77e33d6c8a5e218e948a19e487",
+        "message": "OK",
+        "model_run": "00",
+        "source": "internal:GFS:1",
+    }
+    for index in range(segments):
+        wall_time = first_segment + timedelta(hours=3 * index)
+        payload[f"{wall_time:%Y-%m-%d %H:%M:%S}"] = {
+            "temperature": {"2m": 283.4 + index % 8, "sol": 282.1 + index % 8, "500hPa": -0.1, "850hPa": -0.1},
+            "pression": {"niveau_de_la_mer": 101820 - 10 * index},
+            "pluie": 0.3 * (index % 3),
+            "pluie_convective": 0,
+            "humidite": {"2m": 81.2},
+            "vent_moyen": {"10m": 10.2 + index % 5},
+            "vent_rafales": {"10m": 21.7 + index % 7},
+            "vent_direction": {"10m": 246},
+            "iso_zero": 2143,
+            "risque_neige": "oui" if index == 5 else "non",
+            "cape": 0,
+            "nebulosite": {"haute": 0, "moyenne": 12, "basse": 98, "totale": 98},
+        }
+    return payload
+
+
+# 2026-10-24 02:00 in Paris, the day before the end of DST
+PAYLOAD_NOW = datetime(2026, 10, 24, 0, tzinfo=dt_timezone.utc)
+GFS_PAYLOAD = make_gfs_payload(first_segment=datetime(2026, 10, 23, 20))
+
+
+class ReferenceParisTimezone(tzinfo):
+    # Previous implementation, DST boundaries of the current year computed on each call
+    def __init__(self):
+        self.std_offset = timedelta(hours=1)
+        self.dst_offset = timedelta(hours=2)
+
+    def _last_sunday_in_month(self, year, month):
+        last_day = datetime(year, month + 1, 1) - timedelta(days=1)
+        return last_day - timedelta(days=last_day.weekday() + 1)
+
+    def utcoffset(self, dt):
+        return self.dst_offset if self.dst(dt) else self.std_offset
+
+    def dst(self, dt):
+        dst_start = self._last_sunday_in_month(datetime.now().year, 3).replace(hour=2)
+        dst_end = self._last_sunday_in_month(datetime.now().year, 10).replace(hour=3)
+        return dst_start <= dt.replace(tzinfo=None) < dst_end
+
+
+def reference_parse_forecasts(body: str, latitude: Decimal, longitude: Decimal):
+    # Previous implementation: the body is decoded twice and the offset computed for each key
+    def get_datetime_from_string(date_string):
+        try:
+            return datetime.fromisoformat(
+                date_string + f"+0{int(ReferenceParisTimezone().utcoffset(timezone.now()).seconds / 3600)}:00"
+            )
+        except ValueError:
+            return None
+
+    if json.loads(body)["request_state"] != 200:
+        raise RuntimeError("oupsi")
+    return [
+        Forecast(
+            segment_datetime=key_as_datetime,
+            latitude=latitude,
+            longitude=longitude,
+            data=forecast_data,
+            average_temperature_celsius=Decimal(forecast_data["temperature"]["sol"]) + Decimal("-273.15"),
+            average_wind_speed=mean(Decimal(value) for _key, value in forecast_data["vent_moyen"].items()),
+            wind_gust_speed=max(Decimal(value) for _key, value in forecast_data["vent_rafales"].items()),
+            could_snow=True if forecast_data["risque_neige"] != "non" else False,
+            cloud_coverage=int(forecast_data["nebulosite"]["totale"]),
+        )
+        for key, forecast_data in json.loads(body).items()
+        if (key_as_datetime := get_datetime_from_string(key)) is not None and key_as_datetime >= timezone.now()
+    ]
+
+
+@mock.patch("django.utils.timezone.now", new=lambda: PAYLOAD_NOW)
+class ParseForecastsTestCase(SimpleTestCase):
+    def test_parses_upcoming_segments(self):
+        forecasts = parse_forecasts(GFS_PAYLOAD, Decimal("48.75"), Decimal("2.25"))
+
+        # The 20:00 and 23:00 segments of the 23rd are past, metadata keys are skipped
+        self.assertEqual(len(forecasts), 62)
+        first = forecasts[0]
+        self.assertEqual(first.segment_datetime, PAYLOAD_NOW)
+        self.assertEqual((first.latitude, first.longitude), (Decimal("48.75"), Decimal("2.25")))
+        self.assertAlmostEqual(float(first.average_temperature_celsius), 284.1 - 273.15)
+        self.assertAlmostEqual(float(first.average_wind_speed), 12.2)
+        self.assertAlmostEqual(float(first.wind_gust_speed), 23.7)
+        self.assertEqual(first.cloud_coverage, 98)
+        self.assertEqual([forecast.could_snow for forecast in forecasts].count(True), 1)
+        self.assertIs(first.data, GFS_PAYLOAD["2026-10-24 02:00:00"])
+
+    def test_segment_offsets_follow_their_own_date(self):
+        forecasts = {
+            forecast.segment_datetime.replace(tzinfo=None): forecast
+            for forecast in parse_forecasts(GFS_PAYLOAD, Decimal("48.75"), Decimal("2.25"))
+        }
+
+        self.assertEqual(forecasts[datetime(2026, 10, 24, 20)].segment_datetime.utcoffset(), timedelta(hours=2))
+        self.assertEqual(forecasts[datetime(2026, 10, 25, 5)].segment_datetime.utcoffset(), timedelta(hours=1))
+
+    def test_averages_every_level(self):
+        payload = make_gfs_payload(first_segment=datetime(2026, 10, 24, 5), segments=1)
+        payload["2026-10-24 05:00:00"]["vent_moyen"] = {"10m": 10, "100m": 14}
+        payload["2026-10-24 05:00:00"]["vent_rafales"] = {"10m": 20, "100m": 31}
+
+        forecast, = parse_forecasts(payload, Decimal("48.75"), Decimal("2.25"))
+        self.assertEqual(forecast.average_wind_speed, Decimal(12))
+        self.assertEqual(forecast.wind_gust_speed, Decimal(31))
+
+
+@tag("benchmark")
+@mock.patch("django.utils.timezone.now", new=lambda: PAYLOAD_NOW)
+class ParseForecastsBenchmarkTestCase(SimpleTestCase):
+    def test_faster_than_reference(self):
+        body = json.dumps(GFS_PAYLOAD)
+
+        reference = min(timeit.repeat(
+            lambda: reference_parse_forecasts(body, Decimal("48.75"), Decimal("2.25")),
+            number=50,
+            repeat=3,
+        ))
+        current = min(timeit.repeat(
+            lambda: parse_forecasts(json.loads(body), Decimal("48.75"), Decimal("2.25")),
+            number=50,
+            repeat=3,
+        ))
+        print(f"\nparse_forecasts of 64 segments: {reference * 20:.3f}ms -> {current * 20:.3f}ms per payload")
+        self.assertLess(current, reference)
+
+
+class ParisTimezoneTestCase(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            cls.reference = ZoneInfo("Europe/Paris")
+        except ZoneInfoNotFoundError:
+            raise cls.failureException("The tz database is required to check ParisTimezone") from None
+
+    def sampled_wall_times(self):
+        # Every half hour around both transitions and the new year, for each year
+        for year in range(1996, 2040):
+            for day in (_last_sunday_in_month(year, 3), _last_sunday_in_month(year, 10), datetime(year, 12, 31)):
+                start = day - timedelta(hours=2)
+                for half_hours in range(2 * 30):
+                    yield start + timedelta(minutes=30 * half_hours)
+
+    def test_wall_time_offsets(self):
+        for wall_time in self.sampled_wall_times():
+            for fold in (0, 1):
+                local = wall_time.replace(fold=fold)
+                with self.subTest(wall_time=local, fold=fold):
+                    self.assertEqual(
+                        local.replace(tzinfo=PARIS_TIMEZONE).utcoffset(),
+                        local.replace(tzinfo=self.reference).utcoffset(),
+                    )
+                    self.assertEqual(
+                        local.replace(tzinfo=PARIS_TIMEZONE).dst(),
+                        local.replace(tzinfo=self.reference).dst(),
+                    )
+
+    def test_utc_conversions(self):
+        for wall_time in self.sampled_wall_times():
+            # The sampled wall times are used as UTC instants, around the same transitions
+            utc_time = wall_time.replace(tzinfo=dt_timezone.utc)
+            with self.subTest(utc_time=utc_time):
+                local = utc_time.astimezone(PARIS_TIMEZONE)
+                expected = utc_time.astimezone(self.reference)
+                self.assertEqual(local.replace(tzinfo=None), expected.replace(tzinfo=None))
+                self.assertEqual(local.fold, expected.fold)
+                self.assertEqual(local.astimezone(dt_timezone.utc), utc_time)
+
+    def test_transition_hours(self):
+        # 2024-03-31 02:30 does not exist, 2024-10-27 02:30 happens twice
+        skipped = datetime(2024, 3, 31, 2, 30, tzinfo=PARIS_TIMEZONE)
+        self.assertEqual(skipped.utcoffset(), timedelta(hours=1))
+        self.assertEqual(skipped.replace(fold=1).utcoffset(), timedelta(hours=2))
+
+        repeated = datetime(2024, 10, 27, 2, 30, tzinfo=PARIS_TIMEZONE)
+        self.assertEqual(repeated.tzname(), "CEST")
+        self.assertEqual(repeated.replace(fold=1).tzname(), "CET")
+        self.assertEqual(
+            repeated.replace(fold=1).astimezone(dt_timezone.utc) - repeated.astimezone(dt_timezone.utc),
+            timedelta(hours=1),
+        )
+
+    def test_year_boundaries(self):
+        new_year = datetime(2025, 1, 1, tzinfo=PARIS_TIMEZONE)
+        self.assertEqual(new_year.utcoffset(), timedelta(hours=1))
+        self.assertEqual(
+            datetime(2024, 12, 31, 23, 30, tzinfo=dt_timezone.utc).astimezone(PARIS_TIMEZONE),
+            datetime(2025, 1, 1, 0, 30, tzinfo=PARIS_TIMEZONE),
+        )
+
+
+@override_settings(INFO_CLIMAT_GRID_RESOLUTION=Decimal("0.25"))
+class GridTestCase(SimpleTestCase):
+    def test_snap_to_grid(self):
+        cases = [
+            ((Decimal("48.8566140"), Decimal("2.3522219")), (Decimal("48.7500000"), Decimal("2.2500000"))),
+            ((Decimal("48.875"), Decimal("2.125")), (Decimal("49.0000000"), Decimal("2.2500000"))),  # Halves round up
+            ((Decimal("-0.13"), Decimal("-179.9")), (Decimal("-0.2500000"), Decimal("-180.0000000"))),
+            ((48.86, 2.35), (Decimal("48.7500000"), Decimal("2.2500000"))),
+        ]
+        for location, cell in cases:
+            with self.subTest(location=location):
+                self.assertEqual(snap_to_grid(*location), cell)
+
+    @override_settings(INFO_CLIMAT_GRID_RESOLUTION=Decimal("0.5"))
+    def test_resolution_setting(self):
+        self.assertEqual(snap_to_grid(Decimal("48.86"), Decimal("2.35")), (Decimal("49.0000000"), Decimal("2.5000000")))
+
+
+class SingleFlightTestCase(SimpleTestCase):
+    def run_concurrently(self, single_flight: SingleFlight, key, function, callers: int = 8):
+        results, errors = [], []
+
+        def call():
+            try:
+                results.append(single_flight.do(key, function))
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_concurrent_calls_share_one_call(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(None)
+            release.wait(timeout=2)
+            return "forecasts"
+
+        # Released once the other callers had time to wait on the first one
+        threading.Timer(0.2, release.set).start()
+        results, errors = self.run_concurrently(single_flight, "cell", fetch)
+
+        self.assertEqual((len(calls), results, errors), (1, ["forecasts"] * 8, []))
+        self.assertEqual(single_flight.do("cell", lambda: "again"), "again")
+
+    def test_errors_are_shared_then_forgotten(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+
+        def fail():
+            release.wait(timeout=2)
+            raise RuntimeError("unavailable")
+
+        threading.Timer(0.2, release.set).start()
+        results, errors = self.run_concurrently(single_flight, "cell", fail, callers=4)
+
+        self.assertEqual(results, [])
+        self.assertEqual([str(error) for error in errors], ["unavailable"] * 4)
+        self.assertEqual(single_flight.do("cell", lambda: "recovered"), "recovered")
+
+
+@mock.patch("django.utils.timezone.now", new=lambda: PAYLOAD_NOW)
+class WeatherAPITestCase(SimpleTestCase):
+    def test_fetches_the_grid_cell(self):
+        session = mock.Mock()
+        session.get.return_value.status_code = 200
+        session.get.return_value.json.return_value = GFS_PAYLOAD
+
+        forecasts = WeatherAPI(session=session).fetch_forecasts(Decimal("48.8566140"), Decimal("2.3522219"))
+
+        self.assertIn("_ll=48.7500000,2.2500000&", session.get.call_args.kwargs["url"])
+        self.assertEqual(
+            {(forecast.latitude, forecast.longitude) for forecast in forecasts},
+            {(Decimal("48.7500000"), Decimal("2.2500000"))},
+        )
+
+
+@override_settings(INFO_CLIMAT_RUN_AVAILABILITY_DELAY_MINUTES=300)
+class NextModelUpdateTestCase(SimpleTestCase):
+    def test_next_run_availability(self):
+        cases = [
+            # fetched at -> next run published at
+            (datetime(2026, 10, 18, 4, 59), datetime(2026, 10, 18, 5, 0)),  # 00 UTC run
+            (datetime(2026, 10, 18, 5, 0), datetime(2026, 10, 18, 11, 0)),  # 06 UTC run
+            (datetime(2026, 10, 18, 10, 59), datetime(2026, 10, 18, 11, 0)),
+            (datetime(2026, 10, 18, 23, 30), datetime(2026, 10, 19, 5, 0)),  # next day's 00 UTC run
+            (datetime(2026, 12, 31, 23, 30), datetime(2027, 1, 1, 5, 0)),
+        ]
+        for fetched_at, expected in cases:
+            with self.subTest(fetched_at=fetched_at):
+                self.assertEqual(
+                    next_model_update(fetched_at.replace(tzinfo=dt_timezone.utc)),
+                    expected.replace(tzinfo=dt_timezone.utc),
+                )
+
+
+class ForecastCacheTestCase(TestCase):
+    def setUp(self):
+        self.weather_api = mock.Mock()
+        self.weather_api.get_forecasts.return_value = []
+        self.cache = ForecastCache(max_locations=2, weather_api=self.weather_api)
+        self.segment_datetime = datetime.now(dt_timezone.utc).replace(microsecond=0) + timedelta(hours=3)
+
+    def counter(self, name: str) -> float:
+        return metrics.snapshot()["counters"].get(name, 0)
+
+    def test_miss_then_memory_hit(self):
+        forecasts = save_forecasts([make_forecast(self.segment_datetime)])
+        self.weather_api.get_forecasts.return_value = forecasts
+        Forecast.objects.all().delete()
+        misses, memory_hits = self.counter("forecast_cache.miss"), self.counter("forecast_cache.memory_hit")
+
+        self.assertEqual(self.cache.get_forecasts(Decimal("48.8566"), Decimal("2.3522")), forecasts)
+        self.assertEqual(self.cache.get_forecasts(Decimal("48.8566"), Decimal("2.3522")), forecasts)
+
+        # Both locations snap to the same cell, fetched once
+        self.weather_api.get_forecasts.assert_called_once_with(Decimal("48.7500000"), Decimal("2.2500000"))
+        self.assertEqual(self.counter("forecast_cache.miss"), misses + 1)
+        self.assertEqual(self.counter("forecast_cache.memory_hit"), memory_hits + 1)
+
+    def test_db_hit_after_upsert(self):
+        save_forecasts([make_forecast(self.segment_datetime)])
+        # Pretend the row was written before the last published run
+        Forecast.objects.update(modified_at=datetime.now(dt_timezone.utc) - timedelta(days=1))
+        self.assertEqual(self.cache.get_forecasts(Decimal("48.75"), Decimal("2.25")), [])
+        self.weather_api.get_forecasts.assert_called_once()
+
+        # An upsert refreshes modified_at, the row is fresh again for a new process
+        save_forecasts([make_forecast(self.segment_datetime, cloud_coverage=50)])
+        db_hits = self.counter("forecast_cache.db_hit")
+        forecasts = ForecastCache(max_locations=2, weather_api=self.weather_api).get_forecasts(
+            Decimal("48.75"),
+            Decimal("2.25"),
+        )
+
+        self.assertEqual([forecast.cloud_coverage for forecast in forecasts], [50])
+        self.assertEqual(self.counter("forecast_cache.db_hit"), db_hits + 1)
+        self.weather_api.get_forecasts.assert_called_once()
@@ -1,26 +1,197 @@
+import asyncio
+import itertools
 import json
 import logging
+import os
 import time
-import requests
+from pathlib import Path
+from typing import Any, Dict, List, Optional
 
+import aiohttp
 
-def read_sse(sse_url, server_endpoint):
-    with requests.Session() as session:
-        response = session.get(sse_url, stream=True)
-        response.encoding = 'utf-8'
+SSE_URL = os.getenv("SSE_URL", "http://signal-cli:7583/api/v1/events")
+SERVER_ENDPOINT = os.getenv("SERVER_ENDPOINT", "http://web:8000/poke/")
+SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
 
-        for line in response.iter_lines(decode_unicode=True):
-            if line:
-                try:
-                    event_data = json.loads(line.lstrip("data:"))
-                    requests.post(server_endpoint, json=event_data)
-                except json.JSONDecodeError:
-                    logging.debug(f"Failed to decode JSON: {line}")
+QUEUE_SIZE = int(os.getenv("QUEUE_SIZE", "10000"))
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "500"))
+BATCH_INTERVAL_SECONDS = float(os.getenv("BATCH_INTERVAL_SECONDS", "0.2"))
+POST_TIMEOUT_SECONDS = float(os.getenv("POST_TIMEOUT_SECONDS", "10"))
+RECONNECT_MIN_SECONDS = float(os.getenv("RECONNECT_MIN_SECONDS", "1"))
+RECONNECT_MAX_SECONDS = float(os.getenv("RECONNECT_MAX_SECONDS", "30"))
+# Longer than the interval of signal-cli's keep-alive comments
+SSE_READ_TIMEOUT_SECONDS = float(os.getenv("SSE_READ_TIMEOUT_SECONDS", "60"))
+
+
+class Spool:
+    """
+    On-disk queue of event batches that could not be forwarded, one JSON file per batch.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._counter = itertools.count()
+
+    def write(self, events: List[Dict[str, Any]]):
+        name = f"{time.time_ns():020d}-{next(self._counter):06d}.json"
+        temporary_path = self.directory / (name + ".tmp")
+        temporary_path.write_text(json.dumps(events))
+        # Renaming makes the batch visible only once it is fully written
+        os.replace(temporary_path, self.directory / name)
+
+    def batches(self) -> List[Path]:
+        return sorted(self.directory.glob("*.json"))
+
+    def is_empty(self) -> bool:
+        return next(self.directory.glob("*.json"), None) is None
+
+
+async def post_events(session: aiohttp.ClientSession, events: List[Dict[str, Any]]) -> bool:
+    """
+    Forward `events` to the server, return False if they must be retried later.
+    """
+    try:
+        async with session.post(
+            SERVER_ENDPOINT,
+            json=events,
+            timeout=aiohttp.ClientTimeout(total=POST_TIMEOUT_SECONDS),
+        ) as response:
+            if response.status >= 500:
+                logging.warning(f"Server answered {response.status}, spooling {len(events)} events")
+                return False
+            if response.status >= 400:
+                # Retrying would not help
+                logging.error(f"Server rejected {len(events)} events with {response.status}")
+            return True
+    except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+        logging.warning(f"Failed to reach the server, spooling {len(events)} events: {error!r}")
+        return False
+
+
+async def read_sse(session: aiohttp.ClientSession, queue: asyncio.Queue):
+    last_event_id: Optional[str] = None
+    backoff = RECONNECT_MIN_SECONDS
+
+    while True:
+        headers = {"Accept": "text/event-stream"}
+        if last_event_id is not None:
+            headers["Last-Event-ID"] = last_event_id
+
+        try:
+            async with session.get(
+                SSE_URL,
+                headers=headers,
+                # Without a read timeout, a half-open connection would never be noticed
+                timeout=aiohttp.ClientTimeout(total=None, sock_read=SSE_READ_TIMEOUT_SECONDS),
+            ) as response:
+                response.raise_for_status()
+                logging.warning("Connected to the event stream")
+                backoff = RECONNECT_MIN_SECONDS
+
+                data_lines: List[str] = []
+                async for raw_line in response.content:
+                    # Invalid bytes only spoil the JSON of their own event
+                    line = raw_line.decode("utf-8", errors="replace").rstrip("\r\n")
+
+                    if line == "":
+                        # An empty line dispatches the event
+                        if len(data_lines) > 0:
+                            data = "\n".join(data_lines)
+                            data_lines = []
+                            try:
+                                await queue.put(json.loads(data))
+                            except json.JSONDecodeError:
+                                logging.debug(f"Failed to decode JSON: {data}")
+                        continue
+                    if line.startswith(":"):
+                        continue
+
+                    field, _colon, value = line.partition(":")
+                    if value.startswith(" "):
+                        value = value[1:]
+                    if field == "data":
+                        data_lines.append(value)
+                    elif field == "id":
+                        last_event_id = value
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as error:
+            # ValueError: a line longer than the read buffer
+            logging.warning(f"Event stream failed: {error!r}")
+
+        logging.warning(f"Reconnecting to the event stream in {backoff:.0f}s")
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+
+
+async def forward_events(
+    session: aiohttp.ClientSession,
+    queue: asyncio.Queue,
+    spool: Spool,
+    server_available: asyncio.Event,
+):
+    loop = asyncio.get_running_loop()
+
+    while True:
+        events = [await queue.get()]
+        deadline = loop.time() + BATCH_INTERVAL_SECONDS
+        while len(events) < BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                events.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # While the server is down, new batches go straight to disk behind the spooled ones
+        if server_available.is_set() and await post_events(session, events):
+            continue
+
+        server_available.clear()
+        await asyncio.to_thread(spool.write, events)
+
+
+async def replay_spool(session: aiohttp.ClientSession, spool: Spool, server_available: asyncio.Event):
+    backoff = RECONNECT_MIN_SECONDS
+
+    while True:
+        for path in await asyncio.to_thread(spool.batches):
+            events = json.loads(await asyncio.to_thread(path.read_text))
+            if not await post_events(session, events):
+                break
+            await asyncio.to_thread(path.unlink)
+        else:
+            backoff = RECONNECT_MIN_SECONDS
+            if not server_available.is_set():
+                if await asyncio.to_thread(spool.is_empty):
+                    logging.warning("Server is available again")
+                    server_available.set()
+                # Batches may have been spooled while the last ones were replayed
+                continue
+            await asyncio.sleep(1)
+            continue
+
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+
+
+async def main():
+    queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    spool = Spool(SPOOL_DIR)
+    server_available = asyncio.Event()
+    if spool.is_empty():
+        server_available.set()
+
+    # The read buffer bounds the size of a single SSE line
+    async with aiohttp.ClientSession(read_bufsize=2 ** 20) as session:
+        await asyncio.gather(
+            read_sse(session, queue),
+            forward_events(session, queue, spool, server_available),
+            replay_spool(session, spool, server_available),
+        )
 
 
 if __name__ == "__main__":
     time.sleep(2)
     logging.warning("Waking up the client")
-    sse_url = 'http://signal-cli:7583/api/v1/events'
-    server_endpoint = 'http://web:8000/poke/'
-    read_sse(sse_url, server_endpoint)
+    asyncio.run(main())